@@ -1,58 +1,96 @@
 import streamlit as st
-import pandas as pd
-import re
-import h2o
 import os
-
-try:
-    # Try to start H2O with reduced memory for cloud deployment
-    h2o.init(
-        max_mem_size="256M",  # Reduced memory
-        min_mem_size="128M",
-        nthreads=1,  # Single thread for cloud
-        strict_version_check=False
-    )
-except Exception as e:
-    st.error(f"H2O initialization failed: {e}")
-    st.info("Please ensure Java is installed and available.")
-model_path = "GBM_grid_1_AutoML_1_20250730_201105_model_4"  
-loaded_model = h2o.load_model(model_path)
+import tempfile
+import uuid
+
+# Only light modules at the top: pandas and h2o load with the model in the
+# background, and batch_scoring / what_if are imported where they're used
+from patient_fields import CATEGORY_OPTIONS, required_fields, build_patient_info
+from patient_schema import SCHEMA
+from chat_intents import get_router
+from chat_transcript import Transcript
+from prediction_cache import patient_key
+from metrics import metrics, stage, start_http_exporter
+from scoring import BIAS_TERM, CONTRIBUTION_COLUMNS, get_model_service, risk_band
+from assessment_store import get_assessment_store
+
+# Longest a prediction waits for the background warm-up before giving up
+WARMUP_WAIT_SECS = 120
 
 st.set_page_config(page_title="❤️ Heart Disease Chatbot", page_icon="❤️", layout="wide")
 
-# --- Feature explanations ---
-feature_info = {
-    "ATA": "**Typical Angina (ATA)** 🫀: Classic chest pain with exertion, relieved by rest.",
-    "NAP": "**Non-Anginal Pain (NAP)** 💭: Chest pain not typical of heart disease.",
-    "ASY": "**Asymptomatic (ASY)** 😌: No chest pain symptoms.",
-    "TA": "**Atypical Angina (TA)** 🤔: Chest pain not classic but may indicate heart issues.",
-    "ExerciseAngina": "**Exercise Induced Angina** 🏃‍♀️: Chest pain with exercise.",
-    "FastingBS": "**Fasting Blood Sugar** 🍬: >120 mg/dl may signal diabetes.",
-    "ChestPainType": "**Types of Chest Pain** 💔: Helps differentiate heart-related pain.",
-    "Age": "**Age** 🎂: Risk increases with age.",
-    "Sex": "**Biological Sex** ⚧️: Men develop heart disease earlier.",
-    "RestingBP": "**Resting Blood Pressure** 🩺: Normal <120/80 mmHg.",
-    "Cholesterol": "**Cholesterol** 🧪: High levels clog arteries.",
-    "RestingECG": "**Resting ECG** 📈: Heart electrical activity at rest.",
-    "MaxHR": "**Max Heart Rate** ❤️‍🔥: Highest during exercise.",
-    "Oldpeak": "**ST Depression** 📉: Electrical changes during exercise.",
-    "ST_Slope": "**ST Segment Slope** 📊: Up slope usually better."
-}
-
-# --- Required fields with prompts and validation ranges ---
-required_fields = [
-    ("Age", "What's your age? 🎂 (20-100)", (20, 100)),
-    ("Sex", "What's your biological sex? 👤 ('M' or 'F')", None),
-    ("ChestPainType", "Type of chest pain? 💔 (ATA, NAP, ASY, TA)\n(Type 'what is ATA' for details)", None),
-    ("RestingBP", "Resting blood pressure? 🩺 (90-200 mmHg, or 'unknown')", (90, 200)),
-    ("Cholesterol", "Cholesterol level? 🧪 (100-400 mg/dl, or 'unknown')", (0, 600)),
-    ("FastingBS", "Is fasting blood sugar >120 mg/dl? 🍬 (Yes/No/unknown)", None),
-    ("RestingECG", "Resting ECG result? 📈 (Normal, ST, LVH)\n(Default is 'Normal')", None),
-    ("MaxHR", "Maximum heart rate during exercise? ❤️‍🔥 (60-220 bpm; estimate 220-age if unknown)", (60, 220)),
-    ("ExerciseAngina", "Exercise-induced angina? 🏃‍♀️ (Yes or No)", None),
-    ("Oldpeak", "ST depression value? 📉 (0-6; 0 if unknown)", (0, 6)),
-    ("ST_Slope", "ST segment slope during exercise? 📊 (Up, Flat, Down)", None)
-]
+metrics.inc("reruns_total")
+if 'metrics_session' not in st.session_state:
+    st.session_state.metrics_session = True
+    st.session_state.session_id = uuid.uuid4().hex
+    metrics.inc("sessions_total")
+start_http_exporter()
+
+# Loaded once per process and shared by every session and rerun. The model
+# warms up on a background thread while the welcome message and the first
+# questions render, which need no model at all.
+model_service = get_model_service()
+model_service.start_background()
+if not model_service.ready and not model_service.warming_up and model_service.error:
+    if model_service.fallback is None and not model_service.building_fallback:
+        st.error(f"Model initialization failed: {model_service.error}")
+        st.info("Please ensure Java is installed and available, or set HEART_SCORING_BACKEND=native.")
+        st.stop()
+    # Degraded mode: results come from the precomputed risk table (being
+    # built from the model's tree dump if it's still missing)
+    st.warning("⚠️ The prediction model is unavailable right now, so results are approximate "
+               "estimates from a precomputed risk table. Risk drivers can't be shown until it's back.")
+
+
+def ensure_model_ready(live=False):
+    # With a risk table and a latency budget, single predictions don't wait
+    # past the budget for the warm-up; once it has failed they never wait.
+    # `live` callers (batch scoring) need the model itself
+    wait = WARMUP_WAIT_SECS
+    if not live and model_service.fallback is not None and model_service.latency_budget:
+        wait = model_service.latency_budget
+    if not model_service.ready and wait:
+        with st.spinner("⏳ The model is warming up, this only takes a moment after the app starts..."):
+            model_service.wait_ready(wait)
+    return model_service.ready or (not live and model_service.fallback is not None)
+
+
+# Every result is queued for the assessment store; the write happens on its
+# background thread, never in the rerun
+assessment_store = get_assessment_store()
+
+
+def save_assessment(flow, patient_info, explanation):
+    # model_path records what scored it: the model, or the risk table
+    if assessment_store is not None:
+        assessment_store.record(patient_info, explanation.p1, risk_band(explanation.p1 * 100), flow=flow,
+                                session_id=st.session_state.get('session_id'),
+                                model_path=explanation.source, contributions=explanation.contributions)
+
+# Optional admin panel: HEART_ADMIN=1 or ?admin=1 in the URL
+if os.environ.get("HEART_ADMIN") == "1" or st.query_params.get("admin") == "1":
+    with st.sidebar:
+        st.header("🛠️ Admin: Prediction Metrics")
+        st.json(model_service.health(), expanded=False)
+        stage_rows = metrics.summary()
+        if stage_rows:
+            st.dataframe(stage_rows, hide_index=True)
+        else:
+            st.caption("No predictions yet.")
+        st.json(metrics.counters(), expanded=False)
+        st.download_button("📥 Prometheus metrics", data=metrics.prometheus_text(),
+                           file_name="heart_metrics.prom", mime="text/plain")
+        if assessment_store is not None:
+            st.subheader("🗄️ Saved assessments")
+            st.json(assessment_store.stats(), expanded=False)
+            history_range = st.date_input("Date range (UTC)", value=[], key="history_range")
+            if len(history_range) == 2:
+                assessment_store.flush(timeout=5)
+                history = assessment_store.query(*history_range)
+                st.caption(f"{len(history)} assessments")
+                st.download_button("📥 Assessment history", data=history.to_csv(index=False),
+                                   file_name=f"assessments_{history_range[0]}_{history_range[1]}.csv",
+                                   mime="text/csv")
 
 # --- Clean labels for fast fill-all-at-once mode ---
 simple_labels = {
@@ -70,57 +108,101 @@ simple_labels = {
 }
 
 # --- Utility functions ---
-def build_patient_info(user_dict):
-    defaults = {
-        'Age': 50, 'Sex': 'M', 'ChestPainType': 'ASY', 'RestingBP': 120,
-        'Cholesterol': 200, 'FastingBS': 0, 'RestingECG': 'Normal',
-        'MaxHR': 150, 'ExerciseAngina': 'N', 'Oldpeak': 1.0, 'ST_Slope': 'Up'
-    }
-    info = {}
-    for k, default in defaults.items():
-        info[k] = user_dict.get(k, default)
-    return info
-
 def display_risk(prob_pct):
+    band = risk_band(prob_pct)
     col1, col2 = st.columns([2, 1])
     with col1:
         st.markdown(f"### 🎯 Heart Disease Risk: **{prob_pct:.1f}%**")
         st.progress(min(prob_pct / 100, 1.0))
-        if prob_pct > 70:
+        if band == "HIGH":
             st.error("🚨 **HIGH Risk** - Please consult a cardiologist immediately!")
-        elif prob_pct > 40:
+        elif band == "MODERATE":
             st.warning("⚠️ **MODERATE Risk** - Schedule a check-up with your doctor soon.")
-        elif prob_pct > 20:
+        elif band == "LOW-MODERATE":
             st.info("💙 **LOW-MODERATE Risk** - Consider a routine health check.")
         else:
             st.success("💚 **LOW Risk** - Keep up the great work with your health!")
     with col2:
-        if prob_pct > 70:
+        if band == "HIGH":
             st.markdown("### 🔴")
-        elif prob_pct > 40:
+        elif band == "MODERATE":
             st.markdown("### 🟡")
         else:
             st.markdown("### 🟢")
 
-def show_personalized_tips(info, prob_pct):
+# Tips keyed on the answers the model says raised this patient's risk
+FEATURE_TIPS = {
+    'Cholesterol': "🥗 **Cholesterol Management**: Consider a heart-healthy diet low in saturated fats and regular exercise.",
+    'RestingBP': "🩺 **Blood Pressure**: Monitor regularly and discuss management with your doctor.",
+    'FastingBS': "🍬 **Blood Sugar**: Manage diabetes risk with your healthcare provider.",
+    'ExerciseAngina': "🏃‍♀️ **Exercise**: Discuss safe plans with your doctor.",
+    'MaxHR': "❤️ **Fitness**: Gradually increase cardiovascular fitness (doctor-approved).",
+    'Oldpeak': "🔍 **Follow-up**: Discuss stress test results with cardiologist.",
+    'ST_Slope': "🔍 **Follow-up**: Discuss stress test results with cardiologist.",
+    'ChestPainType': "💔 **Chest Pain**: Describe your chest pain to your doctor, including when it happens.",
+    'RestingECG': "📈 **ECG**: Ask your doctor to go over your resting ECG result.",
+}
+# Contributions below this (log-odds) are too small to call a driver
+MIN_DRIVER_LOGODDS = 0.1
+# Without contributions (risk table estimates) tips follow the answers that
+# are outside the usual healthy ranges instead
+TIP_THRESHOLDS = [
+    ('Cholesterol', lambda v: v > 240),
+    ('RestingBP', lambda v: v > 130),
+    ('FastingBS', lambda v: v == 1),
+    ('ExerciseAngina', lambda v: v == 'Y'),
+    ('MaxHR', lambda v: v < 100),
+    ('Oldpeak', lambda v: v > 2.0),
+]
+
+
+def risk_drivers(contributions):
+    # Features sorted by how much they moved this prediction, largest first
+    drivers = [(k, v) for k, v in contributions.items() if k != BIAS_TERM and abs(v) >= MIN_DRIVER_LOGODDS]
+    return sorted(drivers, key=lambda kv: abs(kv[1]), reverse=True)
+
+def show_risk_drivers(info, contributions):
+    import pandas as pd
+
+    st.markdown("---")
+    st.subheader("🧭 What Drove Your Result")
+    drivers = risk_drivers(contributions)
+    raising = [(k, v) for k, v in drivers if v > 0][:3]
+    lowering = [(k, v) for k, v in drivers if v < 0][:3]
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**⬆️ Raised your risk**")
+        for k, _ in raising:
+            st.write(f"• {k}: {info[k]}")
+        if not raising:
+            st.caption("Nothing stood out.")
+    with col2:
+        st.markdown("**⬇️ Lowered your risk**")
+        for k, _ in lowering:
+            st.write(f"• {k}: {info[k]}")
+        if not lowering:
+            st.caption("Nothing stood out.")
+    with st.expander("📊 Contribution of every answer", expanded=False):
+        st.caption("How far each answer moved the model's score (log-odds) from the average patient. "
+                   "Positive bars raise the risk, negative bars lower it.")
+        chart = pd.DataFrame(
+            {'Contribution': [contributions[k] for k in CONTRIBUTION_COLUMNS if k != BIAS_TERM]},
+            index=[f"{k} = {info[k]}" for k in CONTRIBUTION_COLUMNS if k != BIAS_TERM],
+        )
+        st.bar_chart(chart, height=300)
+
+def show_personalized_tips(info, prob_pct, contributions):
     st.markdown("---")
     st.subheader("🎯 Personalized Health Recommendations")
+    if contributions is None:
+        raising = [k for k, rule in TIP_THRESHOLDS if rule(info[k])]
+    else:
+        raising = [k for k, v in risk_drivers(contributions) if v > 0]
     tips = []
-    if info['Cholesterol'] > 240:
-        tips.append("🥗 **Cholesterol Management**: Consider a heart-healthy diet low in saturated fats and regular exercise.")
-    if info['RestingBP'] > 140:
-        tips.append("🩺 **Blood Pressure**: Monitor regularly and discuss management with your doctor.")
-    elif info['RestingBP'] > 130:
-        tips.append("📊 **Blood Pressure**: Elevated - keep monitoring.")
-    if info['FastingBS'] == 1:
-        tips.append("🍬 **Blood Sugar**: Manage diabetes risk with your healthcare provider.")
-    if info['ExerciseAngina'] == 'Y':
-        tips.append("🏃‍♀️ **Exercise**: Discuss safe plans with your doctor.")
-    if info['MaxHR'] < 100:
-        tips.append("❤️ **Fitness**: Gradually increase cardiovascular fitness (doctor-approved).")
-    if info['Oldpeak'] > 2.0:
-        tips.append("🔍 **Follow-up**: Discuss stress test results with cardiologist.")
-    if not tips:
+    for k in raising:
+        if k in FEATURE_TIPS and FEATURE_TIPS[k] not in tips:
+            tips.append(FEATURE_TIPS[k])
+    if not tips and prob_pct <= 40:
         tips.append("🌟 **Great Job!** Maintain your healthy lifestyle!")
     if prob_pct > 40:
         tips.append("🚨 **Important**: Elevated risk. Consult healthcare professional promptly.")
@@ -131,69 +213,37 @@ def show_personalized_tips(info, prob_pct):
     for i, tip in enumerate(tips, 1):
         st.markdown(f"**{i}.** {tip}")
 
+def show_what_if(patient_info):
+    from what_if import what_if
+
+    # Scored once per patient (all variants in one batch) and kept for reruns
+    key = patient_key(patient_info)
+    if st.session_state.get('what_if', (None,))[0] != key:
+        try:
+            with metrics.timer("prediction_seconds", flow="what_if"):
+                st.session_state['what_if'] = (key, what_if(patient_info, model_service.predict))
+        except Exception as e:
+            st.warning(f"⚠️ What-if analysis unavailable: {e}")
+            return
+    sweep = st.session_state['what_if'][1]
+    with st.expander("🔬 What if...? See how each factor changes your risk", expanded=False):
+        st.caption("Each chart changes one answer and keeps everything else as you entered it.")
+        cols = st.columns(3)
+        for i, (feature, rows) in enumerate(sweep.groupby('feature', sort=False)):
+            with cols[i % 3]:
+                current = rows.loc[rows['is_current'], 'value'].iloc[0]
+                st.markdown(f"**{simple_labels.get(feature, feature)}** (yours: {current})")
+                chart = rows.set_index('value')[['risk_pct']].rename(columns={'risk_pct': 'Risk %'})
+                if feature in CATEGORY_OPTIONS:
+                    chart.index = chart.index.astype(str)
+                    st.bar_chart(chart, height=180)
+                else:
+                    st.line_chart(chart, height=180)
+
 def show_progress():
     progress = len(st.session_state.user_data) / len(required_fields)
     st.progress(progress, f"Progress: {len(st.session_state.user_data)}/{len(required_fields)} questions completed")
 
-def validate_input(current_key, user_text, validation_range=None):
-    user_lower = user_text.lower().strip()
-    try:
-        if current_key in ['FastingBS', 'ExerciseAngina']:
-            if any(w in user_lower for w in ["yes", "y", "1", "true", "positive"]):
-                return (1 if current_key == 'FastingBS' else 'Y'), None
-            elif any(w in user_lower for w in ["no", "n", "0", "false", "negative"]):
-                return (0 if current_key == 'FastingBS' else 'N'), None
-            elif "unknown" in user_lower or "not sure" in user_lower:
-                default_val = 0 if current_key == 'FastingBS' else 'N'
-                return default_val, f"No worries! Using '{default_val}' as default. 👍"
-            else:
-                return None, f"Please answer 'Yes', 'No' or 'unknown'."
-        elif current_key == 'Sex':
-            if user_lower in ['m', 'male']:
-                return 'M', None
-            elif user_lower in ['f', 'female']:
-                return 'F', None
-            else:
-                return None, "Please enter 'M' or 'F'."
-        elif current_key == 'ChestPainType':
-            pain_types = {'ata': 'ATA', 'nap': 'NAP', 'asy': 'ASY', 'ta': 'TA'}
-            if user_lower in pain_types:
-                return pain_types[user_lower], None
-            else:
-                return None, "Enter one of ATA, NAP, ASY, TA."
-        elif current_key == 'RestingECG':
-            ecg_types = {'normal': 'Normal', 'st': 'ST', 'lvh': 'LVH'}
-            if user_lower in ecg_types:
-                return ecg_types[user_lower], None
-            else:
-                return None, "Enter Normal, ST, or LVH."
-        elif current_key == 'ST_Slope':
-            slope_types = {'up': 'Up', 'flat': 'Flat', 'down': 'Down'}
-            if user_lower in slope_types:
-                return slope_types[user_lower], None
-            else:
-                return None, "Enter Up, Flat, or Down."
-        else:  # Numeric
-            if "unknown" in user_lower or "not sure" in user_lower:
-                defaults_for_unknown = {
-                    'Age': 50,
-                    'RestingBP': 120,
-                    'Cholesterol': 200,
-                    'MaxHR': 150,
-                    'Oldpeak': 1.0
-                }
-                default_val = defaults_for_unknown.get(current_key, 0)
-                return default_val, f"Using {default_val} as default."
-            val_float = float(user_text)
-            if validation_range and (val_float < validation_range[0] or val_float > validation_range[1]):
-                return None, f"Please enter a value between {validation_range[0]} and {validation_range[1]}."
-            if current_key in ['Age', 'RestingBP', 'Cholesterol', 'MaxHR']:
-                return int(val_float), None
-            else:
-                return val_float, None
-    except Exception:
-        return None, f"Invalid input format."
-
 # --- Main UI ---
 
 st.title("❤️ Heart Disease Risk Chatbot / Quick Form")
@@ -201,13 +251,13 @@ st.title("❤️ Heart Disease Risk Chatbot / Quick Form")
 # Mode selection
 mode = st.radio(
     "Choose how to input your data:",
-    ("Step-by-step chat (recommended)", "Fill all at once (fastest)"),
+    ("Step-by-step chat (recommended)", "Fill all at once (fastest)", "Upload a file (batch)"),
     key="input_mode"
 )
 
 # Reset button
 if st.button("🔄 Switch input mode / Start Over"):
-    keys_to_clear = ['user_data', 'waiting_for', 'conversation_started', 'last_prediction', 'chat_history']
+    keys_to_clear = ['user_data', 'waiting_for', 'conversation_started', 'last_prediction', 'transcript', 'batch_result']
     for k in keys_to_clear:
         if k in st.session_state:
             if k == 'user_data':
@@ -220,93 +270,142 @@ if st.button("🔄 Switch input mode / Start Over"):
 if mode == "Fill all at once (fastest)" and 'last_prediction' not in st.session_state:
     st.markdown("### 🚀 Fast Mode: Fill All Questions")
     with st.form("full_form"):
+        # Raw widget values; SCHEMA.validate maps "Yes"/"No", parses the
+        # numbers and fills blanks with the same defaults as the chat
         form_values = {}
         for key, label, vrange in required_fields:
             clean_label = simple_labels.get(key, label)
             if key == "Sex":
-                val = st.selectbox(clean_label, options=["M", "F"])
+                val = st.selectbox(clean_label, options=CATEGORY_OPTIONS[key])
 
             elif key == "ChestPainType":
                 val = st.selectbox(
                     clean_label,
-                    options=["ATA", "NAP", "ASY", "TA"],
+                    options=CATEGORY_OPTIONS[key],
                     help="ATA: Typical Angina, NAP: Non-Anginal Pain, ASY: Asymptomatic, TA: Atypical Angina"
                 )
 
             elif key == "RestingECG":
                 val = st.selectbox(
                     clean_label,
-                    options=["Normal", "ST", "LVH"],
+                    options=CATEGORY_OPTIONS[key],
                     help="Normal: Normal ECG, ST: ST-T wave abnormality, LVH: Left Ventricular Hypertrophy"
                 )
 
-            elif key == "ExerciseAngina":
+            elif key in ("ExerciseAngina", "FastingBS"):
                 val = st.radio(clean_label, options=["Yes", "No"], horizontal=True)
-                val = 'Y' if val == "Yes" else 'N'
-
-            elif key == "FastingBS":
-                val = st.radio(
-                    clean_label,
-                    options=["Yes", "No"],
-                    horizontal=True
-                )
-                val = 1 if val == "Yes" else 0
 
             elif key == "ST_Slope":
                 val = st.selectbox(
                     clean_label,
-                    options=["Up", "Flat", "Down"]
+                    options=CATEGORY_OPTIONS[key]
                 )
 
-            elif vrange:
-                minv, maxv = vrange
-                input_val = st.text_input(f"{clean_label}")
-                try:
-                    val = float(input_val)
-                    if val < minv or val > maxv:
-                        st.warning(f"{clean_label} must be between {minv} and {maxv}")
-                    if key in ['Age', 'RestingBP', 'Cholesterol', 'MaxHR']:
-                        val = int(val)
-                except:
-                    val = minv  # fallback
             else:
-                val = st.text_input(clean_label)
+                minv, maxv = vrange
+                val = st.text_input(f"{clean_label}", placeholder=f"{minv}-{maxv}, blank if unknown")
             form_values[key] = val
 
         submitted = st.form_submit_button("Calculate Risk")
 
     if submitted:
-        patient_info = build_patient_info(form_values)
-        df = pd.DataFrame([patient_info])
-        hf = h2o.H2OFrame(df)
-        for c in ['Sex', 'ChestPainType', 'RestingECG', 'ExerciseAngina', 'ST_Slope']:
-            hf[c] = hf[c].asfactor()
-        pred = loaded_model.predict(hf)
-        prob_yes = pred['p1'][0, 0]
-        prob_pct = prob_yes * 100
-        st.session_state['last_prediction'] = (prob_pct, patient_info)
+        with stage("validate_form"):
+            patient_info, form_errors = SCHEMA.validate(form_values)
+        if form_errors:
+            st.error("Please fix these answers:\n\n" + "\n".join(f"- {e}" for e in form_errors.values()))
+            submitted = False
+    if submitted and not ensure_model_ready():
+        st.info("⏳ The model is still warming up. Your answers are kept - press **Calculate Risk** again in a few seconds.")
+    elif submitted:
+        with metrics.timer("prediction_seconds", flow="form"):
+            explanation = model_service.explain_one(patient_info)
+        save_assessment("form", patient_info, explanation)
+        metrics.inc("predictions_total", flow="form")
+        metrics.write_textfile()
+        prob_pct = explanation.p1 * 100
+        st.session_state['last_prediction'] = (prob_pct, patient_info, explanation.contributions)
         st.rerun()
 
+# ========== BATCH FILE UPLOAD ==========
+elif mode == "Upload a file (batch)" and 'last_prediction' not in st.session_state:
+    st.markdown("### 📂 Batch Mode: Score a Whole File")
+    st.caption(
+        "Upload a CSV or Parquet file with one patient per row and columns named "
+        f"{', '.join(k for k, _, _ in required_fields)}. "
+        "Missing or 'unknown' values use the usual defaults; other columns (like a patient ID) are kept."
+    )
+    uploaded = st.file_uploader("Patient file", type=["csv", "parquet"])
+    score_clicked = uploaded is not None and st.button("Score file")
+    if score_clicked and not ensure_model_ready(live=True):
+        st.warning("⚠️ Batch scoring needs the prediction model, which is unavailable right now. Please try again later.")
+    elif score_clicked:
+        from batch_scoring import score_file
+
+        status = st.empty()
+        try:
+            # The results file only lives until it's read back; the session
+            # keeps the bytes (download_button would load them anyway), so
+            # nothing is left on disk when the session is cleared or ends
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                out_path = os.path.join(tmp_dir, "results.csv")
+                summary = score_file(uploaded, out_path, explain=model_service.explain,
+                                     on_chunk=lambda rows: status.text(f"Scored {rows} rows..."))
+                with open(out_path, "rb") as f:
+                    results = f.read()
+        except Exception as e:
+            st.error(f"Batch scoring failed: {e}")
+        else:
+            base_name = os.path.splitext(uploaded.name)[0]
+            st.session_state['batch_result'] = (results, summary, f"{base_name}_risk.csv")
+            status.empty()
+
+    if 'batch_result' in st.session_state:
+        results, summary, file_name = st.session_state['batch_result']
+        st.success(f"✅ Scored {summary['scored']} of {summary['rows']} rows.")
+        if summary['invalid']:
+            st.warning(f"⚠️ {summary['invalid']} rows had invalid values and were not scored - see the 'errors' column.")
+        st.download_button("📥 Download Results", data=results, file_name=file_name, mime="text/csv")
+
 # ========== STEP-BY-STEP CHAT MODE ==========
 elif mode == "Step-by-step chat (recommended)" or 'last_prediction' in st.session_state:
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = [
-            {"role": "bot",
-             "content": "Hello! 👋 I'm your Heart Health Assistant! 🫀\n\n"
-                        "I'll help assess your heart disease risk by asking about your health. Don't worry - this takes just a few minutes, and I'll explain everything along the way! 😊\n\n"
-                        "Type **'help'** anytime for assistance, or **'what is [term]'** for explanations.\n\n"
-                        "Ready to start? Just say 'yes' or 'let's go'! 🚀"}
-        ]
+    # The transcript is only the display log; the question flow state
+    # (user_data, waiting_for, conversation_started) is kept separately
+    if "transcript" not in st.session_state:
+        st.session_state.transcript = Transcript()
+        st.session_state.transcript.add(
+            "bot",
+            "Hello! 👋 I'm your Heart Health Assistant! 🫀\n\n"
+            "I'll help assess your heart disease risk by asking about your health. Don't worry - this takes just a few minutes, and I'll explain everything along the way! 😊\n\n"
+            "Type **'help'** anytime for assistance, or **'what is [term]'** for explanations.\n\n"
+            "Ready to start? Just say 'yes' or 'let's go'! 🚀")
         st.session_state.user_data = {}
         st.session_state.waiting_for = None
         st.session_state.conversation_started = False
         st.session_state.progress_count = 0
 
-    def add_bot_message(msg):
-        st.session_state.chat_history.append({"role": "bot", "content": msg})
+    def add_bot_message(msg, kind=None, term=None):
+        st.session_state.transcript.add("bot", msg, kind=kind, term=term)
 
     def add_user_message(msg):
-        st.session_state.chat_history.append({"role": "user", "content": msg})
+        st.session_state.transcript.add("user", msg)
+
+    def predict_from_chat():
+        if not ensure_model_ready():
+            add_bot_message("⏳ The model is still warming up. Send any message in a few seconds and I'll finish your assessment.")
+            return
+        try:
+            with metrics.timer("prediction_seconds", flow="chat"):
+                with stage("build_patient_info"):
+                    patient_info = build_patient_info(st.session_state.user_data)
+                explanation = model_service.explain_one(patient_info)
+            save_assessment("chat", patient_info, explanation)
+            metrics.inc("predictions_total", flow="chat")
+            metrics.write_textfile()
+            prob_pct = explanation.p1 * 100
+            st.session_state['last_prediction'] = (prob_pct, patient_info, explanation.contributions)
+            add_bot_message(f"✨ Prediction complete! Your heart disease risk is **{prob_pct:.1f}%**.\n\nSee below for your results.")
+        except Exception as e:
+            add_bot_message(f"⚠️ Prediction error: {str(e)}\nPlease try restarting.", kind="error")
 
     if st.session_state.user_data:
         show_progress()
@@ -314,7 +413,13 @@ elif mode == "Step-by-step chat (recommended)" or 'last_prediction' in st.sessio
     st.markdown("### 💬 Chat")
     chat_container = st.container()
     with chat_container:
-        for chat in st.session_state.chat_history:
+        # Only a recent window is rendered; older turns collapse into a summary
+        transcript = st.session_state.transcript
+        full = len(transcript) > transcript.window and st.toggle("Show earlier messages", key="full_transcript")
+        summary = transcript.summary(full)
+        if summary:
+            st.caption(summary)
+        for chat in transcript.recent(full):
             if chat["role"] == "bot":
                 with st.chat_message("assistant", avatar="🤖"):
                     st.markdown(chat["content"])
@@ -325,11 +430,11 @@ elif mode == "Step-by-step chat (recommended)" or 'last_prediction' in st.sessio
     user_message = st.chat_input("Type your message here... 💭", disabled='last_prediction' in st.session_state)
     if user_message:
         add_user_message(user_message)
-        user_text = user_message.strip()
-        user_lower = user_text.lower()
+        intent = get_router().classify(user_message, st.session_state.waiting_for,
+                                       started=st.session_state.conversation_started)
 
         # Help command
-        if user_lower in ['help', 'h', '?']:
+        if intent.kind == 'help':
             help_msg = (
                 "🆘 **Help Menu:**\n\n"
                 "• Type **'what is [term]'** for explanations (e.g., 'what is ATA')\n"
@@ -338,11 +443,11 @@ elif mode == "Step-by-step chat (recommended)" or 'last_prediction' in st.sessio
                 "• For yes/no questions: 'yes', 'no', or 'unknown'\n"
                 "I'm here to help! 😊"
             )
-            add_bot_message(help_msg)
+            add_bot_message(help_msg, kind="help")
             st.rerun()
 
         # Restart command
-        elif user_lower in ['restart', 'reset', 'start over']:
+        elif intent.kind == 'restart':
             st.session_state.user_data = {}
             st.session_state.waiting_for = None
             st.session_state.conversation_started = False
@@ -352,92 +457,79 @@ elif mode == "Step-by-step chat (recommended)" or 'last_prediction' in st.sessio
             st.rerun()
 
         # Explanation commands
-        else:
-            explained = False
-            for term, explanation in feature_info.items():
-                if re.search(fr"what is {term.lower()}", user_lower) or re.search(fr"explain {term.lower()}", user_lower):
-                    add_bot_message(f"📚 **{term} Explanation:**\n\n{explanation}")
-                    explained = True
+        elif intent.kind == 'explain':
+            add_bot_message(f"📚 **{intent.term} Explanation:**\n\n{intent.message}", term=intent.term)
+            st.rerun()
+
+        # Start conversation after user says yes
+        elif intent.kind == 'start':
+            st.session_state.conversation_started = True
+            first_key = required_fields[0][0]
+            st.session_state.waiting_for = first_key
+            add_bot_message(f"Great! Let's start.\n\n**Question 1/{len(required_fields)}:** {required_fields[0][1]}",
+                            kind="question")
+            st.rerun()
+
+        # Handle question flow
+        elif st.session_state.waiting_for and intent.kind in ('skip', 'answer', 'invalid'):
+            current_key = st.session_state.waiting_for
+
+            if intent.kind == 'skip':
+                st.session_state.user_data[current_key] = SCHEMA.defaults[current_key]
+                add_bot_message(f"👍 Using default for {current_key}, moving on...")
+            elif intent.kind == 'answer':
+                st.session_state.user_data[current_key] = intent.value
+                add_bot_message(f"✅ Recorded {current_key}. {intent.message or ''}".strip())
+            else:
+                add_bot_message(intent.message, kind="invalid")
+                st.rerun()
+
+            # Determine next question or finish
+            current_index = next(i for i, (f, _, _) in enumerate(required_fields) if f == current_key)
+            next_field = None
+            for j in range(current_index + 1, len(required_fields)):
+                if required_fields[j][0] not in st.session_state.user_data:
+                    next_field = required_fields[j][0]
                     break
+            if next_field:
+                st.session_state.waiting_for = next_field
+                q_num = len(st.session_state.user_data) + 1
+                # Important: keep full label here!
+                next_label = next((lab for k, lab, _ in required_fields if k == next_field), "")
+                add_bot_message(f"**Question {q_num}/{len(required_fields)}:** {next_label}", kind="question")
+            else:
+                # All done
+                add_bot_message("🎉 All done! Analyzing your data now...")
+                st.session_state.waiting_for = None
+                predict_from_chat()
+            st.rerun()
 
-            if not explained:
-                # Start conversation after user says yes
-                if not st.session_state.conversation_started and any(w in user_lower for w in ['yes', 'go', 'start', 'let\'s go', 'sure']):
-                    st.session_state.conversation_started = True
-                    first_key = required_fields[0][0]
-                    st.session_state.waiting_for = first_key
-                    add_bot_message(f"Great! Let's start.\n\n**Question 1/{len(required_fields)}:** {required_fields[0][1]}")
-                    st.rerun()
-
-                # Handle question flow
-                elif st.session_state.waiting_for:
-                    current_key = st.session_state.waiting_for
-                    current_field_info = next((f for f in required_fields if f[0] == current_key), None)
-                    validation_range = current_field_info[2] if current_field_info else None
-
-                    if user_lower in ["skip", "pass", "default"]:
-                        defaults = {
-                            'Age': 50, 'Sex': 'M', 'ChestPainType': 'ASY', 'RestingBP': 120,
-                            'Cholesterol': 200, 'FastingBS': 0, 'RestingECG': 'Normal',
-                            'MaxHR': 150, 'ExerciseAngina': 'N', 'Oldpeak': 1.0, 'ST_Slope': 'Up'
-                        }
-                        st.session_state.user_data[current_key] = defaults[current_key]
-                        add_bot_message(f"👍 Using default for {current_key}, moving on...")
-                    else:
-                        validated_value, err_msg = validate_input(current_key, user_text, validation_range)
-                        if validated_value is not None:
-                            st.session_state.user_data[current_key] = validated_value
-                            add_bot_message(f"✅ Recorded {current_key}. {err_msg or ''}".strip())
-                        else:
-                            add_bot_message(err_msg)
-                            st.rerun()
-
-                    # Determine next question or finish
-                    if current_key in st.session_state.user_data:
-                        current_index = next(i for i, (f, _, _) in enumerate(required_fields) if f == current_key)
-                        next_field = None
-                        for j in range(current_index + 1, len(required_fields)):
-                            if required_fields[j][0] not in st.session_state.user_data:
-                                next_field = required_fields[j][0]
-                                break
-                        if next_field:
-                            st.session_state.waiting_for = next_field
-                            q_num = len(st.session_state.user_data) + 1
-                            # Important: keep full label here!
-                            next_label = next((lab for k, lab, _ in required_fields if k == next_field), "")
-                            add_bot_message(f"**Question {q_num}/{len(required_fields)}:** {next_label}")
-                        else:
-                            # All done
-                            add_bot_message("🎉 All done! Analyzing your data now...")
-                            st.session_state.waiting_for = None
-                            try:
-                                patient_info = build_patient_info(st.session_state.user_data)
-                                df = pd.DataFrame([patient_info])
-                                hf = h2o.H2OFrame(df)
-                                for c in ['Sex', 'ChestPainType', 'RestingECG', 'ExerciseAngina', 'ST_Slope']:
-                                    hf[c] = hf[c].asfactor()
-                                pred = loaded_model.predict(hf)
-                                prob_yes = pred['p1'][0, 0]
-                                prob_pct = prob_yes * 100
-                                st.session_state['last_prediction'] = (prob_pct, patient_info)
-                                add_bot_message(f"✨ Prediction complete! Your heart disease risk is **{prob_pct:.1f}%**.\n\nSee below for your results.")
-                            except Exception as e:
-                                add_bot_message(f"⚠️ Prediction error: {str(e)}\nPlease try restarting.")
-                    st.rerun()
-                else:
-                    if not st.session_state.conversation_started:
-                        add_bot_message("Hi! Ready to start? Just say 'yes' or 'let's go'!")
-                    else:
-                        add_bot_message("I didn't understand that. Type 'help' for instructions.")
-                    st.rerun()
+        # All answers in but the model was still warming up last time
+        elif len(st.session_state.user_data) == len(required_fields):
+            predict_from_chat()
+            st.rerun()
+        else:
+            if not st.session_state.conversation_started:
+                add_bot_message("Hi! Ready to start? Just say 'yes' or 'let's go'!")
+            else:
+                add_bot_message("I didn't understand that. Type 'help' for instructions.", kind="invalid")
+            st.rerun()
 
 # --- Result display (shared) ---
 if 'last_prediction' in st.session_state:
     st.markdown("---")
     st.markdown("## 📊 Your Heart Health Assessment Results")
-    prob_pct, patient_info = st.session_state['last_prediction']
+    prob_pct, patient_info, contributions = st.session_state['last_prediction']
     display_risk(prob_pct)
-    show_personalized_tips(patient_info, prob_pct)
+    if contributions is None:
+        # Scored by the risk table: an estimate, and no per-answer breakdown
+        st.caption("ℹ️ This is an approximate estimate from a precomputed risk table, because the prediction "
+                   "model was unavailable or slow. Ask again later for the model's exact result and its drivers.")
+    else:
+        show_risk_drivers(patient_info, contributions)
+    show_personalized_tips(patient_info, prob_pct, contributions)
+    if contributions is not None:
+        show_what_if(patient_info)
 
     with st.expander("🔍 View Your Input Data", expanded=False):
         col1, col2 = st.columns(2)
@@ -454,7 +546,7 @@ if 'last_prediction' in st.session_state:
     col1, col2, col3 = st.columns(3)
     with col1:
         if st.button("🔄 New Assessment"):
-            keys_to_clear = ['user_data', 'waiting_for', 'conversation_started', 'last_prediction', 'chat_history']
+            keys_to_clear = ['user_data', 'waiting_for', 'conversation_started', 'last_prediction', 'transcript']
             for k in keys_to_clear:
                 if k in st.session_state:
                     if k == 'user_data':
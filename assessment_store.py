@@ -0,0 +1,231 @@
+# --- Append-only store of completed assessments (SQLite, WAL mode) ---
+#
+# The app hands each result to `record()`, which only puts it on a bounded
+# queue; a background thread writes queued rows in batches, one transaction
+# per batch. If the writer falls behind and the queue is full, the result is
+# dropped and counted (heart_assessments_dropped_total) rather than making the
+# user wait. Everything still queued is written at interpreter exit.
+#
+#   HEART_ASSESSMENT_DB=assessments.sqlite3   database path ("" disables saving)
+#
+#   python assessment_store.py --start 2026-10-01 --end 2026-10-17 [--out history.csv]
+
+import argparse
+import atexit
+import datetime as dt
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from metrics import metrics
+from patient_fields import CATEGORICAL_COLUMNS, FEATURE_COLUMNS, INTEGER_COLUMNS
+
+ASSESSMENT_DB = os.environ.get("HEART_ASSESSMENT_DB", "assessments.sqlite3")
+MAX_QUEUE = 10000
+BATCH_SIZE = 256
+FLUSH_INTERVAL_SECS = 1.0
+
+COLUMNS = ['created_at', 'flow', 'session_id', 'model_path', 'p1', 'risk_band'] + FEATURE_COLUMNS + ['contributions']
+_FEATURE_TYPES = {key: 'TEXT' if key in CATEGORICAL_COLUMNS else 'INTEGER' if key in INTEGER_COLUMNS + ['FastingBS']
+                  else 'REAL' for key in FEATURE_COLUMNS}
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS assessments (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    flow TEXT,
+    session_id TEXT,
+    model_path TEXT,
+    p1 REAL,
+    risk_band TEXT,
+    {', '.join(f'{key} {_FEATURE_TYPES[key]}' for key in FEATURE_COLUMNS)},
+    contributions TEXT
+);
+CREATE INDEX IF NOT EXISTS assessments_created_at ON assessments (created_at);
+"""
+
+
+def load_history(start=None, end=None, columns=None, path=ASSESSMENT_DB):
+    # Assessments with start <= created_at < end as a DataFrame, oldest
+    # first. Both bounds are optional; the range scan uses the created_at
+    # index and a read-only connection, so it never waits on the writer.
+    import pandas as pd
+
+    where, params = [], []
+    if start is not None:
+        where.append("created_at >= ?")
+        params.append(_timestamp(start))
+    if end is not None:
+        where.append("created_at < ?")
+        params.append(_timestamp(end, end=True))
+    sql = f"SELECT {', '.join(columns or COLUMNS)} FROM assessments"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at"
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        df = pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+    if 'created_at' in df:
+        df['created_at'] = pd.to_datetime(df['created_at'], unit='s', utc=True)
+    return df
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _plain(value):
+    # numpy scalars -> Python values sqlite3 can bind
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _timestamp(value, end=False):
+    # date / datetime / ISO string -> unix seconds (UTC); a plain date as an
+    # end bound means "through the end of that day"
+    if isinstance(value, str):
+        value = dt.date.fromisoformat(value) if len(value) == 10 else dt.datetime.fromisoformat(value)
+    if not isinstance(value, dt.datetime):
+        value = dt.datetime.combine(value + dt.timedelta(days=1) if end else value, dt.time())
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=dt.timezone.utc)
+    return value.timestamp()
+
+
+class AssessmentStore:
+    def __init__(self, path=ASSESSMENT_DB, max_queue=MAX_QUEUE, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL_SECS):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self.error = None
+        with _connect(path) as conn:
+            conn.executescript(SCHEMA)
+        conn.close()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="assessment-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, patient_info, p1, risk_band, flow=None, session_id=None, model_path=None,
+               contributions=None, created_at=None):
+        # Never blocks: a full queue drops the row
+        row = [created_at or time.time(), flow, session_id, model_path, float(p1), risk_band]
+        row += [_plain(patient_info.get(key)) for key in FEATURE_COLUMNS]
+        if contributions is not None:
+            contributions = json.dumps({key: float(value) for key, value in contributions.items()})
+        row.append(contributions)
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            metrics.inc("assessments_dropped_total")
+            return False
+        return True
+
+    def _run(self):
+        conn = _connect(self.path)
+        insert = f"INSERT INTO assessments ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        stop = False
+        while not stop:
+            batch, waiters = [], []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    # flush(): write what we have now, then wake the caller
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or waiters or len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    with conn:
+                        conn.executemany(insert, batch)
+                    self.written += len(batch)
+                    metrics.inc("assessments_written_total", len(batch))
+                except sqlite3.Error as e:
+                    self.error = e
+                    metrics.inc("assessments_failed_total", len(batch))
+            for waiter in waiters:
+                waiter.set()
+        conn.close()
+
+    def flush(self, timeout=None):
+        # Blocks until everything queued before this call is written
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=10):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {'path': self.path, 'queued': self._queue.qsize(), 'written': self.written,
+                'dropped': self.dropped, 'error': str(self.error) if self.error else None}
+
+    def query(self, start=None, end=None, columns=None):
+        return load_history(start, end, columns, path=self.path)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_assessment_store():
+    # Process-wide store, or None when HEART_ASSESSMENT_DB is empty
+    global _store
+    with _store_lock:
+        if _store is None and ASSESSMENT_DB:
+            _store = AssessmentStore()
+        return _store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load saved assessments for a date range.")
+    parser.add_argument("--db", default=ASSESSMENT_DB)
+    parser.add_argument("--start", default=None, help="First day (YYYY-MM-DD, UTC)")
+    parser.add_argument("--end", default=None, help="Last day, inclusive (YYYY-MM-DD, UTC)")
+    parser.add_argument("--out", default=None, help="Write the rows to this CSV instead of a summary")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        parser.exit(1, f"{args.db} does not exist\n")
+    df = load_history(args.start, args.end, path=args.db)
+    if args.out:
+        df.to_csv(args.out, index=False)
+        print(f"Wrote {len(df)} assessments to {args.out}")
+        return
+    print(f"{len(df)} assessments")
+    if len(df):
+        summary = df.groupby([df['created_at'].dt.date, 'risk_band']).size().unstack(fill_value=0)
+        print(summary.to_string())
+
+
+if __name__ == "__main__":
+    main()
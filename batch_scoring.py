@@ -0,0 +1,150 @@
+# --- Bulk scoring of CSV / Parquet patient exports ---
+#
+# The input is read in chunks; each chunk is validated column by column
+# against the same schema as the chat and form (patient_schema.py) and scored
+# as one frame. Results are appended to the output file chunk by chunk, so
+# memory stays flat no matter how large the input is. When scored with an `explain` function the
+# output also gets one contrib_<feature> column per feature (log-odds, from
+# the same pass as p1).
+#
+#   python batch_scoring.py patients.csv results.csv [--chunksize 10000] [--backend native]
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from patient_fields import FEATURE_COLUMNS
+from patient_schema import SCHEMA
+from scoring import CONTRIBUTION_COLUMNS, risk_bands
+
+DEFAULT_CHUNKSIZE = 10000
+
+CONTRIBUTION_PREFIX = 'contrib_'
+RESULT_COLUMNS = ['p1', 'risk_band', 'errors'] + [CONTRIBUTION_PREFIX + c for c in CONTRIBUTION_COLUMNS]
+
+
+def _is_parquet(path):
+    name = getattr(path, 'name', path)
+    return str(name).lower().endswith(('.parquet', '.pq'))
+
+
+def read_chunks(source, chunksize=DEFAULT_CHUNKSIZE):
+    if _is_parquet(source):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, chunksize=chunksize, dtype=str, keep_default_na=True)
+
+
+def prepare_chunk(chunk):
+    # Returns (patients, errors): the model columns with defaults filled in
+    # (also for invalid cells, whose raw value is quoted in the error), and a
+    # per-row error message ('' when the row is valid)
+    return SCHEMA.validate_frame(chunk)
+
+
+def score_chunk(chunk, predict=None, explain=None):
+    # Give either predict (p1 only) or explain (p1 and contributions)
+    patients, errors = prepare_chunk(chunk)
+    valid = (errors == '').to_numpy()
+    p1 = np.full(len(chunk), np.nan)
+    contributions = np.full((len(chunk), len(CONTRIBUTION_COLUMNS)), np.nan) if explain else None
+    if valid.any():
+        rows = patients[valid].reset_index(drop=True)
+        if explain:
+            p1[valid], contributions[valid] = explain(rows)
+        else:
+            p1[valid] = predict(rows)
+    extra = [c for c in chunk.columns if c not in FEATURE_COLUMNS and c not in RESULT_COLUMNS]
+    result = pd.concat([chunk[extra], patients], axis=1)
+    result['p1'] = p1
+    result['risk_band'] = risk_bands(p1 * 100)
+    result['errors'] = errors
+    if explain:
+        for j, name in enumerate(CONTRIBUTION_COLUMNS):
+            result[CONTRIBUTION_PREFIX + name] = contributions[:, j]
+    return result
+
+
+class _ResultWriter:
+    def __init__(self, target):
+        self.target = target
+        self.parquet = _is_parquet(target)
+        self._writer = None
+        self._schema = None
+        self._wrote_header = False
+
+    def write(self, result):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(result, preserve_index=False)
+            if self._writer is None:
+                # A column that is all empty in the first chunk (a blank CSV
+                # column, risk_band when nothing was valid) would be typed
+                # null; later chunks are cast to this one schema
+                self._schema = pa.schema([f.with_type(pa.string()) if pa.types.is_null(f.type) else f
+                                          for f in table.schema]).remove_metadata()
+                self._writer = pq.ParquetWriter(self.target, self._schema)
+            self._writer.write_table(table.cast(self._schema))
+        else:
+            result.to_csv(self.target, mode='a' if self._wrote_header else 'w',
+                          header=not self._wrote_header, index=False)
+            self._wrote_header = True
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def score_file(source, target, predict=None, chunksize=DEFAULT_CHUNKSIZE, on_chunk=None, explain=None):
+    # Streams `source` through `predict` (or `explain`) into `target`; returns
+    # summary counts
+    writer = _ResultWriter(target)
+    rows = invalid = 0
+    try:
+        for chunk in read_chunks(source, chunksize):
+            result = score_chunk(chunk, predict, explain)
+            writer.write(result)
+            rows += len(result)
+            invalid += int((result['errors'] != '').sum())
+            if on_chunk:
+                on_chunk(rows)
+    finally:
+        writer.close()
+    return {'rows': rows, 'scored': rows - invalid, 'invalid': invalid}
+
+
+def main(argv=None):
+    from scoring import ModelService
+
+    parser = argparse.ArgumentParser(description="Score a CSV or Parquet file of patients.")
+    parser.add_argument("input", help="CSV or Parquet file with one patient per row")
+    parser.add_argument("output", help="Results file (.csv or .parquet)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--backend", default=None, help="Scoring backend: h2o or native")
+    parser.add_argument("--model", default=None, help="Path of the saved H2O model")
+    parser.add_argument("--no-contributions", action="store_true",
+                        help="Only write p1 and risk_band, without contrib_* columns")
+    args = parser.parse_args(argv)
+
+    if os.path.abspath(args.input) == os.path.abspath(args.output):
+        parser.error("output must be a different file from input")
+    service = ModelService(args.backend, args.model)
+    if not service.start():
+        parser.exit(1, f"Model initialization failed: {service.error}\n")
+    if args.no_contributions:
+        summary = score_file(args.input, args.output, service.predict, args.chunksize)
+    else:
+        summary = score_file(args.input, args.output, chunksize=args.chunksize, explain=service.explain)
+    print(f"Scored {summary['scored']} of {summary['rows']} rows "
+          f"({summary['invalid']} invalid) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
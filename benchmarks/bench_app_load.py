@@ -0,0 +1,300 @@
+# --- Concurrent-session load test of the Streamlit app (headless, offline) ---
+#
+# Simulates N users in one process with streamlit.testing AppTest. Chat users
+# answer the step-by-step questions with realistic replies mixed with "help",
+# "what is ..." questions, "skip" and the odd answer the bot can't use. Form
+# users fill the fast form and press Calculate Risk. Every user shares the
+# process-wide model service, cache and metrics, as sessions do in a real
+# Streamlit server.
+#
+# AppTest can't run scripts on several threads at once, so the harness is a
+# small discrete-event scheduler: each user waits an exponential think time
+# (--think-ms, 0 = back to back) between interactions, and the user whose turn
+# comes first runs next. Script runs are therefore serialized, which is also
+# what CPU-bound reruns amount to under the GIL. Background threads (model
+# warm-up, assessment writer, shadow scoring) still run concurrently.
+#
+# Reported per user count: script reruns/s, interaction latency, time from a
+# user's first message to their result, session_state size (pickled) at the
+# start and at the result, and process RSS growth. The JSON report uses the
+# run_benchmarks.py format, so two runs can be checked for regressions:
+#
+#   python benchmarks/bench_app_load.py --users 1 8 32 --out load.json
+#   python benchmarks/run_benchmarks.py compare load_baseline.json load.json
+#
+# Runs against the bundled model (an empty registry is used) unless --model
+# is given. Assessments go to a temporary database.
+
+import argparse
+import heapq
+import json
+import os
+import pickle
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+APP_PATH = os.path.join(REPO_ROOT, "app.py")
+
+CHAT_MODE = "Step-by-step chat (recommended)"
+FORM_MODE = "Fill all at once (fastest)"
+NUMERIC_FIELDS = ['Age', 'RestingBP', 'Cholesterol', 'MaxHR', 'Oldpeak']
+SELECT_FIELDS = ['Sex', 'ChestPainType', 'RestingECG', 'ST_Slope']
+YES_NO_FIELDS = ['FastingBS', 'ExerciseAngina']
+EXPLAIN_TERMS = ['ATA', 'ST_Slope', 'Oldpeak', 'cholesterol', 'ASY', 'exercise angina']
+# Per-question chances of each detour before the real answer
+P_HELP = 0.08
+P_EXPLAIN = 0.1
+P_SKIP = 0.08
+P_INVALID = 0.05
+APP_TIMEOUT_SECS = 120
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float('nan')
+
+
+def _state_bytes(at):
+    try:
+        return len(pickle.dumps(at.session_state.to_dict()))
+    except Exception:
+        return float('nan')
+
+
+def _chat_answer(key, value, rng):
+    # A few phrasings per field, all of which the router understands
+    if key in ('Sex',):
+        return rng.choice([value, {'M': 'male', 'F': 'female'}[value], f"I'm {'a man' if value == 'M' else 'a woman'}"])
+    if key in YES_NO_FIELDS:
+        yes = value in (1, 'Y')
+        return rng.choice(['yes', 'yeah', 'Yes'] if yes else ['no', 'nope', 'No'])
+    if key in SELECT_FIELDS:
+        return rng.choice([value, value.lower(), f"it was {value}"])
+    if key == 'Age':
+        return rng.choice([str(value), f"I'm {value}", f"{value} years old"])
+    return rng.choice([str(value), f"about {value}", f"{value} I think"])
+
+
+def chat_user(at, patient, rng):
+    # Generator of interactions; each yield is one rerun-triggering message
+    at.chat_input[0].set_value("yes").run()
+    yield
+    for key, value in patient.items():
+        if rng.random() < P_HELP:
+            at.chat_input[0].set_value("help").run()
+            yield
+        if rng.random() < P_EXPLAIN:
+            at.chat_input[0].set_value(f"what is {rng.choice(EXPLAIN_TERMS)}").run()
+            yield
+        if rng.random() < P_SKIP:
+            at.chat_input[0].set_value("skip").run()
+            yield
+            continue
+        if rng.random() < P_INVALID:
+            at.chat_input[0].set_value("banana").run()
+            yield
+        at.chat_input[0].set_value(_chat_answer(key, value, rng)).run()
+        yield
+
+
+def form_user(at, patient, rng):
+    at.radio(key="input_mode").set_value(FORM_MODE).run()
+    yield
+    for widget, key in zip(at.text_input, NUMERIC_FIELDS):
+        widget.input(str(patient[key]))
+    for widget, key in zip(at.selectbox, SELECT_FIELDS):
+        widget.select(patient[key])
+    answers = [r for r in at.radio if r.key != "input_mode"]
+    for widget, key in zip(answers, YES_NO_FIELDS):
+        widget.set_value("Yes" if patient[key] in (1, 'Y') else "No")
+    next(b for b in at.button if "Calculate" in b.label).click().run()
+    yield
+
+
+class SimUser:
+    def __init__(self, index, flow, patient, seed):
+        from streamlit.testing.v1 import AppTest
+
+        self.index = index
+        self.flow = flow
+        self.rng = random.Random(seed)
+        self.at = AppTest.from_file(APP_PATH, default_timeout=APP_TIMEOUT_SECS)
+        self.steps = (chat_user if flow == "chat" else form_user)(self.at, patient, self.rng)
+        self.started = None
+        self.finished = None
+        self.state_start = None
+        self.state_end = None
+        self.error = None
+        self.interactions = 0
+
+    def step(self):
+        # Runs one interaction; returns False once the user is done
+        if self.started is None:
+            self.started = time.perf_counter()
+            self.at.run()
+            self.state_start = _state_bytes(self.at)
+            return True
+        try:
+            next(self.steps)
+            self.interactions += 1
+            if self.at.exception:
+                raise RuntimeError(self.at.exception[0].message)
+        except StopIteration:
+            pass
+        except Exception as e:
+            self.error = str(e)
+            return False
+        if "last_prediction" in self.at.session_state:
+            self.finished = time.perf_counter()
+            self.state_end = _state_bytes(self.at)
+            return False
+        return True
+
+
+def run_level(users, chat_share, think_ms, seed):
+    from metrics import metrics
+    from patient_fields import random_patients
+
+    rng = random.Random(seed)
+    patients = random_patients(users, seed=seed)
+    sim = [SimUser(i, "chat" if rng.random() < chat_share else "form", patients[i], seed * 1000 + i)
+           for i in range(users)]
+    reruns_before = metrics.counters().get('reruns_total', 0)
+    rss_before = _rss_mb()
+    latencies = []
+    start = time.perf_counter()
+    queue = [(start, i) for i in range(users)]
+    heapq.heapify(queue)
+    while queue:
+        ready_at, i = heapq.heappop(queue)
+        wait = ready_at - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        step_start = time.perf_counter()
+        more = sim[i].step()
+        now = time.perf_counter()
+        latencies.append(now - step_start)
+        if more:
+            think = rng.expovariate(1000 / think_ms) if think_ms > 0 else 0.0
+            heapq.heappush(queue, (now + think, i))
+    elapsed = time.perf_counter() - start
+    reruns = metrics.counters().get('reruns_total', 0) - reruns_before
+
+    done = [u for u in sim if u.finished is not None]
+    ttp = np.array([u.finished - u.started for u in done]) * 1000
+    lat = np.array(latencies) * 1000
+    start_kb = np.array([u.state_start for u in done]) / 1024
+    end_kb = np.array([u.state_end for u in done]) / 1024
+    return {
+        'users': users,
+        'chat_users': sum(u.flow == "chat" for u in sim),
+        'completed': len(done),
+        'errors': [f"user {u.index} ({u.flow}): {u.error}" for u in sim if u.error],
+        'elapsed_s': elapsed,
+        'reruns': reruns,
+        'reruns_per_sec': reruns / elapsed,
+        'interactions': len(lat),
+        'interaction_p50_ms': float(np.percentile(lat, 50)),
+        'interaction_p99_ms': float(np.percentile(lat, 99)),
+        'time_to_prediction_p50_ms': float(np.percentile(ttp, 50)) if len(ttp) else float('nan'),
+        'time_to_prediction_p95_ms': float(np.percentile(ttp, 95)) if len(ttp) else float('nan'),
+        'session_state_start_kb': float(start_kb.mean()) if len(done) else float('nan'),
+        'session_state_end_kb': float(end_kb.mean()) if len(done) else float('nan'),
+        'rss_growth_mb': _rss_mb() - rss_before,
+    }
+
+
+def _metric(value, unit, better):
+    return {'unit': unit, 'better': better, 'value': value}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the Streamlit app with simulated concurrent sessions.")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 8, 32], help="Concurrent users per level")
+    parser.add_argument("--chat-share", type=float, default=0.7, help="Fraction of users taking the chat")
+    parser.add_argument("--think-ms", type=float, default=0,
+                        help="Mean pause between a user's interactions (0 = no pause)")
+    parser.add_argument("--backend", default="native", help="h2o or native")
+    parser.add_argument("--model", default=None, help="Saved H2O model (default: the bundled one)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="Write a JSON report (run_benchmarks.py format)")
+    args = parser.parse_args(argv)
+
+    # Configure before anything imports scoring / assessment_store
+    scratch = tempfile.mkdtemp(prefix="heart_load_")
+    os.environ["HEART_SCORING_BACKEND"] = args.backend
+    os.environ["HEART_MODELS_DIR"] = os.path.join(scratch, "models")
+    os.environ["HEART_ASSESSMENT_DB"] = os.path.join(scratch, "assessments.sqlite3")
+    # Measure the live model only: no risk table fallback, and no table build
+    # competing for the CPU
+    os.environ["HEART_RISK_TABLE"] = ""
+    if args.model:
+        os.environ["HEART_MODEL_PATH"] = args.model
+    os.chdir(REPO_ROOT)
+
+    from scoring import get_model_service
+
+    # One session up front so the levels measure a warm model
+    started = time.perf_counter()
+    warmup = run_level(1, 0.0, 0, args.seed + 999)
+    if warmup['errors'] or not warmup['completed']:
+        parser.exit(1, f"Warm-up session failed: {warmup['errors']}\n")
+    service = get_model_service()
+    print(f"backend={service.backend} model={service.model_path} warm-up {time.perf_counter() - started:.1f}s")
+
+    results = [run_level(n, args.chat_share, args.think_ms, args.seed + n) for n in args.users]
+
+    print(f"{'users':>6}{'done':>6}{'reruns/s':>10}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'ttp p50 s':>11}{'ttp p95 s':>11}{'state KB':>14}{'RSS +MB':>9}")
+    for r in results:
+        print(f"{r['users']:>6}{r['completed']:>6}{r['reruns_per_sec']:>10.1f}{r['interaction_p50_ms']:>9.1f}"
+              f"{r['interaction_p99_ms']:>9.1f}{r['time_to_prediction_p50_ms'] / 1000:>11.2f}"
+              f"{r['time_to_prediction_p95_ms'] / 1000:>11.2f}"
+              f"{r['session_state_start_kb']:>6.1f} -> {r['session_state_end_kb']:<5.1f}{r['rss_growth_mb']:>9.1f}")
+        for error in r['errors']:
+            print(f"  {error}")
+
+    if args.out:
+        metrics = {}
+        for r in results:
+            n = r['users']
+            metrics[f'app_reruns_per_sec_{n}u'] = _metric(r['reruns_per_sec'], 'reruns/s', 'higher')
+            metrics[f'app_step_p99_{n}u'] = _metric(r['interaction_p99_ms'], 'ms', 'lower')
+            metrics[f'app_ttp_p50_{n}u'] = _metric(r['time_to_prediction_p50_ms'], 'ms', 'lower')
+            metrics[f'app_state_kb_{n}u'] = _metric(r['session_state_end_kb'], 'KB', 'lower')
+        report = {
+            'meta': {
+                'backend': service.backend,
+                'model_path': service.model_path,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'timestamp': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                'seed': args.seed,
+                'chat_share': args.chat_share,
+                'think_ms': args.think_ms,
+                'levels': results,
+            },
+            'metrics': metrics,
+        }
+        with open(args.out, "w") as f:
+            f.write(json.dumps(report, indent=2) + "\n")
+        print(f"Wrote {args.out}")
+    if any(r['errors'] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
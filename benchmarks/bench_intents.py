@@ -0,0 +1,159 @@
+# --- Intent router vs the original chat command chain: accuracy and speed ---
+#
+# The legacy chain below is the message handling app.py used before
+# chat_intents.py: exact-match commands, two f-string regexes per feature_info
+# term, substring start words and validate_input's substring yes/no checks.
+#
+#   python benchmarks/bench_intents.py [--repeat 200] [--show-errors]
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_intents import get_router  # noqa: E402
+from patient_fields import feature_info, required_fields  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_intents_corpus.json")
+
+
+def legacy_validate_input(current_key, user_text, validation_range=None):
+    user_lower = user_text.lower().strip()
+    try:
+        if current_key in ['FastingBS', 'ExerciseAngina']:
+            if any(w in user_lower for w in ["yes", "y", "1", "true", "positive"]):
+                return (1 if current_key == 'FastingBS' else 'Y'), None
+            elif any(w in user_lower for w in ["no", "n", "0", "false", "negative"]):
+                return (0 if current_key == 'FastingBS' else 'N'), None
+            elif "unknown" in user_lower or "not sure" in user_lower:
+                default_val = 0 if current_key == 'FastingBS' else 'N'
+                return default_val, f"No worries! Using '{default_val}' as default. 👍"
+            else:
+                return None, f"Please answer 'Yes', 'No' or 'unknown'."
+        elif current_key == 'Sex':
+            if user_lower in ['m', 'male']:
+                return 'M', None
+            elif user_lower in ['f', 'female']:
+                return 'F', None
+            else:
+                return None, "Please enter 'M' or 'F'."
+        elif current_key == 'ChestPainType':
+            pain_types = {'ata': 'ATA', 'nap': 'NAP', 'asy': 'ASY', 'ta': 'TA'}
+            if user_lower in pain_types:
+                return pain_types[user_lower], None
+            else:
+                return None, "Enter one of ATA, NAP, ASY, TA."
+        elif current_key == 'RestingECG':
+            ecg_types = {'normal': 'Normal', 'st': 'ST', 'lvh': 'LVH'}
+            if user_lower in ecg_types:
+                return ecg_types[user_lower], None
+            else:
+                return None, "Enter Normal, ST, or LVH."
+        elif current_key == 'ST_Slope':
+            slope_types = {'up': 'Up', 'flat': 'Flat', 'down': 'Down'}
+            if user_lower in slope_types:
+                return slope_types[user_lower], None
+            else:
+                return None, "Enter Up, Flat, or Down."
+        else:  # Numeric
+            if "unknown" in user_lower or "not sure" in user_lower:
+                defaults_for_unknown = {
+                    'Age': 50,
+                    'RestingBP': 120,
+                    'Cholesterol': 200,
+                    'MaxHR': 150,
+                    'Oldpeak': 1.0
+                }
+                default_val = defaults_for_unknown.get(current_key, 0)
+                return default_val, f"Using {default_val} as default."
+            val_float = float(user_text)
+            if validation_range and (val_float < validation_range[0] or val_float > validation_range[1]):
+                return None, f"Please enter a value between {validation_range[0]} and {validation_range[1]}."
+            if current_key in ['Age', 'RestingBP', 'Cholesterol', 'MaxHR']:
+                return int(val_float), None
+            else:
+                return val_float, None
+    except Exception:
+        return None, f"Invalid input format."
+
+
+def legacy_classify(text, waiting_for=None, started=True):
+    user_text = text.strip()
+    user_lower = user_text.lower()
+    if user_lower in ['help', 'h', '?']:
+        return {'kind': 'help'}
+    if user_lower in ['restart', 'reset', 'start over']:
+        return {'kind': 'restart'}
+    for term in feature_info:
+        if re.search(fr"what is {term.lower()}", user_lower) or re.search(fr"explain {term.lower()}", user_lower):
+            return {'kind': 'explain', 'term': term}
+    if not started and any(w in user_lower for w in ['yes', 'go', 'start', 'let\'s go', 'sure']):
+        return {'kind': 'start'}
+    if waiting_for:
+        if user_lower in ["skip", "pass", "default"]:
+            return {'kind': 'skip'}
+        vrange = next(f[2] for f in required_fields if f[0] == waiting_for)
+        value, _ = legacy_validate_input(waiting_for, user_text, vrange)
+        if value is None:
+            return {'kind': 'invalid'}
+        return {'kind': 'answer', 'value': value}
+    return {'kind': 'unknown'}
+
+
+def router_classify(text, waiting_for=None, started=True):
+    intent = get_router().classify(text, waiting_for, started)
+    result = {'kind': intent.kind}
+    if intent.kind == 'answer':
+        result['value'] = intent.value
+    elif intent.kind == 'explain':
+        result['term'] = intent.term
+    return result
+
+
+def matches(result, expected):
+    return all(result.get(k) == v for k, v in expected.items())
+
+
+def evaluate(classify, corpus, repeat):
+    errors = []
+    for case in corpus:
+        result = classify(case['text'], case['waiting_for'], case['started'])
+        if not matches(result, case['expected']):
+            errors.append((case, result))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for case in corpus:
+            classify(case['text'], case['waiting_for'], case['started'])
+    elapsed = time.perf_counter() - start
+    return {
+        'accuracy': 1 - len(errors) / len(corpus),
+        'us_per_message': elapsed / (repeat * len(corpus)) * 1e6,
+        'errors': errors,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the intent router with the legacy chat chain.")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--show-errors", action="store_true")
+    args = parser.parse_args(argv)
+
+    with open(CORPUS) as f:
+        corpus = json.load(f)
+    get_router()  # built once per process, like in the app
+    print(f"{len(corpus)} messages")
+    print(f"{'parser':<8}{'accuracy':>10}{'us/msg':>10}")
+    for name, classify in (("legacy", legacy_classify), ("router", router_classify)):
+        result = evaluate(classify, corpus, args.repeat)
+        print(f"{name:<8}{result['accuracy']:>10.1%}{result['us_per_message']:>10.2f}")
+        if args.show_errors:
+            for case, got in result['errors']:
+                print(f"    {case['waiting_for'] or '-':<15}{case['text']!r:<28}expected {case['expected']} got {got}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# --- Worker startup time and memory: h2o.load_model vs the native model files ---
+#
+# Starts N worker processes per mode and measures, for each worker, the time
+# to import the scoring code, the time to load the model and score one
+# patient, and its memory once ready:
+#   h2o   - ModelService("h2o"): h2o.init + h2o.load_model (+ the JVM's own RSS)
+#   json  - NativeGBM.load on the JSON tree dump (parsed into private arrays)
+#   flat  - NativeGBM.load_flat on the .native.bin file (memory-mapped, shared)
+# RSS counts shared pages in full for every process; PSS splits them between
+# the processes that map them, so summed PSS is the real cost on the host.
+#
+#   python benchmarks/bench_model_loading.py --workers 4 --modes h2o json flat
+#
+# Linux only (reads /proc).
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+mode, model_path = sys.argv[1], sys.argv[2]
+from patient_fields import PATIENT_DEFAULTS
+if mode == "h2o":
+    from scoring import ModelService
+    imported = time.perf_counter()
+    service = ModelService("h2o", model_path)
+    if not service.start():
+        raise SystemExit(f"h2o failed: {service.error}")
+else:
+    from native_scorer import NativeGBM, artifact_path_for, flat_path_for
+    imported = time.perf_counter()
+    path = artifact_path_for(model_path) if mode == "json" else flat_path_for(model_path)
+    NativeGBM.load(path).predict([PATIENT_DEFAULTS])
+done = time.perf_counter()
+print("READY", imported - start, done - imported, flush=True)
+sys.stdin.readline()
+"""
+
+
+def _proc_kb(pid, filename, field):
+    try:
+        with open(f"/proc/{pid}/{filename}") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def memory_mb(pid):
+    return {
+        'rss_mb': _proc_kb(pid, "status", "VmRSS") / 1024,
+        'pss_mb': _proc_kb(pid, "smaps_rollup", "Pss") / 1024,
+    }
+
+
+def h2o_jvm_pids():
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read()
+        except OSError:
+            continue
+        if b"h2o.jar" in cmdline and b"java" in cmdline:
+            pids.append(int(entry))
+    return pids
+
+
+def run_mode(mode, workers, model_path):
+    jvms_before = set(h2o_jvm_pids())
+    procs, results = [], []
+    spawned = time.perf_counter()
+    for _ in range(workers):
+        procs.append(subprocess.Popen([sys.executable, "-c", WORKER_SCRIPT, mode, model_path], cwd=REPO_ROOT,
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True))
+    try:
+        for proc in procs:
+            line = proc.stdout.readline()
+            while line and not line.startswith("READY"):
+                line = proc.stdout.readline()
+            if not line:
+                raise RuntimeError(f"{mode} worker exited before it was ready")
+            _, import_s, model_s = line.split()
+            results.append({'ready_s': time.perf_counter() - spawned, 'import_s': float(import_s),
+                            'model_ms': float(model_s) * 1000, **memory_mb(proc.pid)})
+        jvm = {}
+        if mode == "h2o":
+            pids = h2o_jvm_pids()
+            jvm = {'jvm_rss_mb': sum(memory_mb(p)['rss_mb'] for p in pids),
+                   'jvm_started_here': bool(set(pids) - jvms_before)}
+    finally:
+        for proc in procs:
+            proc.stdin.close()
+            proc.wait()
+    n = len(results)
+    return {
+        'mode': mode,
+        'workers': n,
+        'import_s': sum(r['import_s'] for r in results) / n,
+        'model_ms': sum(r['model_ms'] for r in results) / n,
+        'ready_s': max(r['ready_s'] for r in results),
+        'rss_mb_per_worker': sum(r['rss_mb'] for r in results) / n,
+        'pss_mb_total': sum(r['pss_mb'] for r in results),
+        **jvm,
+    }
+
+
+def main(argv=None):
+    sys.path.insert(0, REPO_ROOT)
+    from native_scorer import NativeGBM, artifact_path_for, flat_path_for
+    from scoring import MODEL_PATH
+
+    parser = argparse.ArgumentParser(description="Compare worker startup time and memory per model format.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", default=["h2o", "json", "flat"], choices=["h2o", "json", "flat"])
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    model_path = os.path.join(REPO_ROOT, args.model)
+    if "flat" in args.modes and not os.path.exists(flat_path_for(model_path)):
+        NativeGBM.load(artifact_path_for(model_path)).save_flat(flat_path_for(model_path))
+
+    results = [run_mode(mode, args.workers, model_path) for mode in args.modes]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<6}{'workers':>8}{'import s':>10}{'model ms':>10}{'all ready s':>13}"
+          f"{'RSS MB/worker':>15}{'PSS MB total':>14}")
+    for r in results:
+        print(f"{r['mode']:<6}{r['workers']:>8}{r['import_s']:>10.2f}{r['model_ms']:>10.1f}{r['ready_s']:>13.2f}"
+              f"{r['rss_mb_per_worker']:>15.1f}{r['pss_mb_total']:>14.1f}")
+        if 'jvm_rss_mb' in r:
+            started = "started by the workers" if r['jvm_started_here'] else "already running"
+            print(f"{'':<6}+ H2O JVM RSS {r['jvm_rss_mb']:.0f} MB ({started})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# --- Throughput / tail latency: direct scoring vs the micro-batching server ---
+#
+# Simulates N concurrent sessions, each sending single-patient requests back to
+# back, once calling the scorer directly and once through prediction_server.
+#
+#   python benchmarks/bench_prediction_server.py --backend h2o --sessions 1 8 32
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from patient_fields import random_patients  # noqa: E402
+from prediction_server import PredictionClient, start_in_thread  # noqa: E402
+from scoring import ModelService  # noqa: E402
+
+
+def run_sessions(predict_factory, sessions, requests):
+    latencies = [[] for _ in range(sessions)]
+    patients = random_patients(sessions * requests, seed=42)
+    barrier = threading.Barrier(sessions + 1)
+
+    def session(i):
+        predict = predict_factory()
+        mine = patients[i * requests:(i + 1) * requests]
+        barrier.wait()
+        for patient in mine:
+            start = time.perf_counter()
+            predict([patient])
+            latencies[i].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    all_ms = np.array([x for lat in latencies for x in lat]) * 1000
+    return {
+        'sessions': sessions,
+        'requests': int(all_ms.size),
+        'throughput_rps': all_ms.size / elapsed,
+        'p50_ms': float(np.percentile(all_ms, 50)),
+        'p99_ms': float(np.percentile(all_ms, 99)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark direct scoring against the prediction server.")
+    parser.add_argument("--backend", default=None, help="h2o or native")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="Requests per session")
+    parser.add_argument("--window-ms", type=float, default=5)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    service = ModelService(args.backend)
+    if not service.start():
+        parser.exit(1, f"Model initialization failed: {service.error}\n")
+    port = start_in_thread(service.predict, window_ms=args.window_ms, max_batch=args.max_batch)
+    client = PredictionClient(("127.0.0.1", port))
+
+    results = []
+    for sessions in args.sessions:
+        for mode, factory in (("direct", lambda: service.predict), ("server", lambda: client.predict)):
+            result = run_sessions(factory, sessions, args.requests)
+            result['mode'] = mode
+            results.append(result)
+
+    if args.json:
+        print(json.dumps({'backend': service.backend, 'results': results}, indent=2))
+        return
+    print(f"backend={service.backend} window={args.window_ms}ms max_batch={args.max_batch}")
+    print(f"{'mode':<8}{'sessions':>9}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['sessions']:>9}{r['throughput_rps']:>10.1f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# --- Scoring micro-benchmarks with regression thresholds ---
+#
+# Runs offline against the bundled model (pinned, so an active version in the
+# model registry doesn't change what is measured; --model picks another) with
+# synthetic patients drawn from the required_fields ranges, and writes the
+# results as JSON:
+#
+#   python benchmarks/run_benchmarks.py run --backend h2o --out bench.json
+#   python benchmarks/run_benchmarks.py compare baseline.json bench.json --threshold 0.25
+#
+# `compare` exits with status 1 when any metric regresses by more than the
+# threshold (relative; latencies may not grow, throughputs may not shrink).
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from chat_intents import get_router  # noqa: E402
+from patient_fields import build_patient_info, random_patients  # noqa: E402
+from scoring import BUNDLED_MODEL_PATH, ModelService  # noqa: E402
+
+CHAT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_replies.json")
+BATCH_SIZES = (1, 10, 100, 10000)
+EXPLAIN_SIZES = (1, 100, 10000)
+
+COLD_START_SCRIPT = """
+import time
+start = time.perf_counter()
+from scoring import ModelService
+service = ModelService({backend!r}, {model_path!r})
+ok = service.start()
+print("COLD_START_SECONDS", time.perf_counter() - start if ok else -1)
+"""
+
+
+def timed(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    ms = np.array(samples) * 1000
+    return {'unit': 'ms', 'better': 'lower', 'n': repeat, 'value': float(np.median(ms)),
+            'p95': float(np.percentile(ms, 95)), 'min': float(ms.min())}
+
+
+def bench_cold_start(backend, model_path, repeat):
+    # A fresh interpreter each time: imports, h2o.init (JVM boot when no
+    # cluster is running) and load_model, plus the warm-up prediction
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", COLD_START_SCRIPT.format(backend=backend, model_path=model_path)],
+                             cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+        marker = [line for line in out.stdout.splitlines() if line.startswith("COLD_START_SECONDS")]
+        seconds = float(marker[-1].split()[1]) if marker else -1
+        if seconds < 0:
+            raise RuntimeError(f"Cold start failed:\n{out.stderr}")
+        samples.append(seconds * 1000)
+    ms = np.array(samples)
+    return {'unit': 'ms', 'better': 'lower', 'n': repeat, 'value': float(np.median(ms)),
+            'p95': float(np.percentile(ms, 95)), 'min': float(ms.min())}
+
+
+def bench_validate_input(repeat):
+    # Chat answer validation (validate_input, now IntentRouter.parse_answer)
+    with open(CHAT_CORPUS) as f:
+        corpus = json.load(f)
+    replies = [(r['field'], r['text']) for r in corpus]
+    parse_answer = get_router().parse_answer
+
+    def run():
+        for field, text in replies:
+            parse_answer(field, text)
+
+    result = timed(run, repeat)
+    per_second = len(replies) / (result['value'] / 1000)
+    return {'unit': 'replies/s', 'better': 'higher', 'n': repeat, 'value': per_second,
+            'corpus_size': len(replies)}
+
+
+def run(args):
+    service = ModelService(args.backend, args.model)
+    if not service.start():
+        raise SystemExit(f"Model initialization failed: {service.error}")
+    scorer = service.scorer
+    patients = random_patients(max(BATCH_SIZES) + args.repeat, seed=args.seed)
+    results = {}
+
+    if not args.skip_cold_start:
+        results['cold_start'] = bench_cold_start(service.backend, service.model_path, args.cold_repeat)
+
+    singles = iter(patients)
+    results['predict_single_warm'] = timed(lambda: scorer.predict([next(singles)]), args.repeat)
+
+    for size in BATCH_SIZES:
+        rows = patients[:size]
+        repeat = max(3, args.repeat // max(1, size // 100)) if size > 1 else args.repeat
+        results[f'predict_batch_{size}'] = timed(lambda: scorer.predict(rows), repeat)
+
+    # p1 plus per-feature contributions, comparable to predict_batch_*
+    for size in EXPLAIN_SIZES:
+        rows = patients[:size]
+        repeat = max(3, args.repeat // max(1, size // 100))
+        results[f'explain_batch_{size}'] = timed(lambda: scorer.explain(rows), repeat)
+
+    # Partial answers, as the chat collects them, through defaults and the
+    # cached service path (cache cleared so every call really scores)
+    answers = [{k: v for k, v in p.items() if k not in ('RestingBP', 'Oldpeak')} for p in patients]
+    partial = iter(answers)
+
+    def end_to_end():
+        service.cache.clear()
+        service.predict_one(build_patient_info(next(partial)))
+
+    results['end_to_end_single'] = timed(end_to_end, args.repeat)
+    results['validate_input'] = bench_validate_input(args.repeat)
+
+    report = {
+        'meta': {
+            'backend': service.backend,
+            'model_path': service.model_path,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            'seed': args.seed,
+        },
+        'metrics': results,
+    }
+    with open(args.out, "w") as f:
+        f.write(json.dumps(report, indent=2) + "\n")
+    print(f"\n{'metric':<24}{'value':>14}  unit")
+    for name, result in results.items():
+        print(f"{name:<24}{result['value']:>14.3f}  {result['unit']}")
+    print(f"\nWrote {args.out}")
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline_report = json.load(f)
+    with open(args.current) as f:
+        current_report = json.load(f)
+    baseline, current = baseline_report['metrics'], current_report['metrics']
+    for key in ('backend', 'model_path'):
+        before, after = baseline_report['meta'].get(key), current_report['meta'].get(key)
+        if before != after:
+            print(f"Note: the reports differ in {key} ({before} vs {after}); changes may not be regressions\n")
+    overrides = dict(item.split("=", 1) for item in args.metric_threshold)
+
+    failures = []
+    print(f"{'metric':<24}{'baseline':>14}{'current':>14}{'change':>10}")
+    for name, base in baseline.items():
+        if name not in current:
+            print(f"{name:<24}{base['value']:>14.3f}{'missing':>14}")
+            continue
+        value = current[name]['value']
+        change = (value - base['value']) / base['value'] if base['value'] else 0.0
+        worse = change if base.get('better', 'lower') == 'lower' else -change
+        limit = float(overrides.get(name, args.threshold))
+        flag = "  REGRESSION" if worse > limit else ""
+        print(f"{name:<24}{base['value']:>14.3f}{value:>14.3f}{change:>+10.1%}{flag}")
+        if flag:
+            failures.append(name)
+    if failures:
+        print(f"\n{len(failures)} metric(s) regressed past the threshold: {', '.join(failures)}")
+        sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scoring micro-benchmarks for the heart disease model.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="Run the benchmarks and write a JSON report")
+    p_run.add_argument("--backend", default=None, help="h2o, native or server")
+    p_run.add_argument("--model", default=BUNDLED_MODEL_PATH,
+                       help="Saved H2O model to benchmark (default: the bundled one, whatever the registry says)")
+    p_run.add_argument("--repeat", type=int, default=50)
+    p_run.add_argument("--cold-repeat", type=int, default=3)
+    p_run.add_argument("--skip-cold-start", action="store_true")
+    p_run.add_argument("--seed", type=int, default=0)
+    p_run.add_argument("--out", default="benchmark_results.json", help="Where to write the JSON report")
+    p_run.set_defaults(func=run)
+
+    p_cmp = sub.add_parser("compare", help="Fail if a metric regressed against a baseline")
+    p_cmp.add_argument("baseline")
+    p_cmp.add_argument("current")
+    p_cmp.add_argument("--threshold", type=float, default=0.2,
+                       help="Allowed relative regression (default 0.2 = 20%%)")
+    p_cmp.add_argument("--metric-threshold", action="append", default=[], metavar="NAME=X",
+                       help="Per-metric threshold override")
+    p_cmp.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# --- Precompiled intent and answer parser for chat messages ---
+#
+# Built once from feature_info, the patient schema (answer spellings, ranges,
+# defaults) and the command vocabularies, then classifies a message in one
+# pass with word-boundary matching, so "no" doesn't fire inside "not sure"
+# and "y" doesn't match any word containing a y.
+
+import re
+from collections import namedtuple
+
+from patient_fields import UNKNOWN_PHRASES, feature_info, required_fields
+from patient_schema import SCHEMA
+
+# kind is one of: help, restart, skip, explain, start, answer, invalid, unknown
+Intent = namedtuple('Intent', ['kind', 'value', 'term', 'message'], defaults=[None, None, None])
+
+HELP_WORDS = ['help', 'h', '?']
+RESTART_WORDS = ['restart', 'reset', 'start over']
+SKIP_WORDS = ['skip', 'pass', 'default']
+START_WORDS = ['yes', 'y', 'yeah', 'yep', 'sure', 'ok', 'okay', 'ready', 'go', "let's go", 'lets go', 'start', "let's start"]
+EXPLAIN_PREFIXES = [r'what\s+is', r"what's", r'whats', r'what\s+does', r'what\s+are', r'explain', r'define', r'meaning\s+of']
+
+# "1,200" is grouped thousands, "1,5" a decimal comma, ".5" a bare fraction
+NUMBER_RE = re.compile(r'(?<![\w.])[-+]?(?:(?P<grouped>\d{1,3}(?:,\d{3})+)(?![\d.,])|\d+(?:[.,]\d+)?|\.\d+)')
+# The diastolic half of a "130/85" reading
+DIASTOLIC_RE = re.compile(r'(?<=\d)\s*/\s*\d+')
+
+
+def _alternation(words):
+    # Longest first so multi-word phrases win over their prefixes
+    return '|'.join(re.escape(w) for w in sorted(set(words), key=len, reverse=True))
+
+
+def _phrase_re(words):
+    return re.compile(rf'(?<![\w\'-])(?:{_alternation(words)})(?![\w\'-])')
+
+
+def _term_pattern(term):
+    # "ExerciseAngina" also matches "exercise angina", "ST_Slope" "st slope"
+    parts = [p for p in re.split(r'_|(?<=[a-z])(?=[A-Z])', term) if p]
+    return r'[\s_-]*'.join(re.escape(p.lower()) for p in parts)
+
+
+class IntentRouter:
+    def __init__(self, feature_info, required_fields):
+        self.feature_info = feature_info
+        self.fields = {key: (prompt, vrange) for key, prompt, vrange in required_fields}
+
+        commands = [('help', HELP_WORDS), ('restart', RESTART_WORDS), ('skip', SKIP_WORDS)]
+        self._command_re = re.compile(
+            r'\s*(?:' + '|'.join(f'(?P<{kind}>{_alternation(words)})' for kind, words in commands) + r')\s*[.!]*\s*'
+        )
+
+        # One named group per term; longest patterns first
+        terms = sorted(feature_info, key=lambda t: len(_term_pattern(t)), reverse=True)
+        self._term_groups = {f't{i}': term for i, term in enumerate(terms)}
+        term_alternation = '|'.join(f'(?P<t{i}>{_term_pattern(term)})' for i, term in enumerate(terms))
+        self._explain_re = re.compile(
+            rf'\b(?:{"|".join(EXPLAIN_PREFIXES)})\s+(?:an?\s+|the\s+)?(?:{term_alternation})(?![\w])'
+        )
+
+        self._start_re = _phrase_re(START_WORDS)
+        self._unknown_re = _phrase_re(UNKNOWN_PHRASES)
+        self._answer_res = {key: _phrase_re(field.aliases) for key, field in SCHEMA.fields.items() if field.aliases}
+
+    def classify(self, text, waiting_for=None, started=True):
+        lower = text.strip().lower()
+        m = self._command_re.fullmatch(lower)
+        if m:
+            return Intent(m.lastgroup)
+        m = self._explain_re.search(lower)
+        if m:
+            term = self._term_groups[m.lastgroup]
+            return Intent('explain', term=term, message=self.feature_info[term])
+        if waiting_for:
+            value, message = self.parse_answer(waiting_for, lower)
+            if value is None:
+                return Intent('invalid', message=message)
+            return Intent('answer', value=value, message=message)
+        if not started and self._start_re.search(lower):
+            return Intent('start')
+        return Intent('unknown')
+
+    def parse_answer(self, key, text):
+        # Same contract as validate_input: (value, note) or (None, error)
+        lower = text.strip().lower()
+        field = SCHEMA.fields[key]
+        if self._unknown_re.search(lower):
+            if key in ('FastingBS', 'ExerciseAngina'):
+                return field.default, f"No worries! Using '{field.default}' as default. 👍"
+            return field.default, f"Using {field.default} as default."
+
+        if key in self._answer_res:
+            # Exactly one option may be named ("yes and no" is ambiguous)
+            found = {field.aliases[w] for w in self._answer_res[key].findall(lower)}
+            if len(found) != 1:
+                return None, f"Please enter {field.expected}."
+            return found.pop(), None
+
+        if key == 'RestingBP':
+            lower = DIASTOLIC_RE.sub('', lower)
+        # Exactly one number: "220-48" or "between 130 and 140" is not an answer
+        numbers = list(NUMBER_RE.finditer(lower))
+        error = len(numbers) != 1
+        if not error:
+            m = numbers[0]
+            number = float(m.group().replace(',', '') if m.group('grouped') else m.group().replace(',', '.'))
+            value, error = SCHEMA.check(key, number)
+        if error:
+            return None, f"Please enter {field.expected}."
+        return value, None
+
+
+_router = None
+
+
+def get_router():
+    global _router
+    if _router is None:
+        _router = IntentRouter(feature_info, required_fields)
+    return _router
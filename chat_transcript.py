@@ -0,0 +1,82 @@
+# --- Bounded chat transcript ---
+#
+# The display log for the step-by-step chat, kept apart from the question flow
+# state (user_data / waiting_for live in st.session_state on their own). At
+# most TRANSCRIPT_MAX_MESSAGES are stored. Older ones are folded into a
+# one-line summary, counted by kind, and each rerun renders only the summary
+# plus the last TRANSCRIPT_WINDOW messages, so rendering cost and session
+# memory stay flat however long the conversation runs.
+
+from collections import Counter
+
+TRANSCRIPT_MAX_MESSAGES = 60
+TRANSCRIPT_WINDOW = 12
+# Longer user messages are shortened for display (the router still sees all of it)
+MAX_MESSAGE_CHARS = 500
+
+# Message kinds, used to summarize what scrolled out of the window
+SUMMARY_LABELS = [
+    ('question', "question asked", "questions asked"),
+    ('help', "help request", "help requests"),
+    ('invalid', "answer I couldn't use", "answers I couldn't use"),
+    ('error', "error", "errors"),
+]
+
+
+def _plural(n, singular, plural):
+    return f"{n} {singular if n == 1 else plural}"
+
+
+class Transcript:
+    def __init__(self, max_messages=TRANSCRIPT_MAX_MESSAGES, window=TRANSCRIPT_WINDOW):
+        self.max_messages = max_messages
+        self.window = window
+        self.messages = []
+        self.folded = 0
+        self.folded_kinds = Counter()
+        self.folded_terms = []
+
+    def add(self, role, content, kind=None, term=None):
+        # role is "bot" or "user"; kind / term only feed the summary
+        if role == "user" and len(content) > MAX_MESSAGE_CHARS:
+            content = content[:MAX_MESSAGE_CHARS] + "…"
+        self.messages.append({"role": role, "content": content, "kind": kind, "term": term})
+        if len(self.messages) > self.max_messages:
+            # Fold in chunks so the list isn't shifted on every message
+            drop = len(self.messages) - self.max_messages + self.window
+            for message in self.messages[:drop]:
+                self._fold(message)
+            del self.messages[:drop]
+
+    def _fold(self, message):
+        self.folded += 1
+        if message["kind"]:
+            self.folded_kinds[message["kind"]] += 1
+        if message["term"] and message["term"] not in self.folded_terms:
+            self.folded_terms.append(message["term"])
+
+    def __len__(self):
+        return self.folded + len(self.messages)
+
+    def recent(self, full=False):
+        # Messages to render: the window, or everything still stored
+        return list(self.messages) if full else self.messages[-self.window:]
+
+    def summary(self, full=False):
+        # Markdown for the block above the rendered messages, None if nothing is hidden
+        shown = self.recent(full)
+        hidden = len(self) - len(shown)
+        if not hidden:
+            return None
+        kinds = self.folded_kinds.copy()
+        terms = list(self.folded_terms)
+        for message in self.messages[:len(self.messages) - len(shown)]:
+            if message["kind"]:
+                kinds[message["kind"]] += 1
+            if message["term"] and message["term"] not in terms:
+                terms.append(message["term"])
+        parts = [_plural(kinds[kind], singular, plural) for kind, singular, plural in SUMMARY_LABELS if kinds[kind]]
+        if terms:
+            parts.append("explained " + ", ".join(terms))
+        text = f"🗂️ **{_plural(hidden, 'earlier message', 'earlier messages')}**"
+        return text + (f": {'; '.join(parts)}." if parts else ".")
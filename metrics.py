@@ -0,0 +1,189 @@
+# --- Process-wide latency and counter metrics for the prediction path ---
+#
+# Stages are timed with `with stage("name"):` and kept both as Prometheus
+# histograms (for p50/p95/p99 via histogram_quantile) and as a bounded window of
+# recent samples for the admin panel. Export options:
+#   HEART_METRICS_FILE=/path/heart.prom  - textfile, rewritten after each prediction
+#   HEART_METRICS_PORT=9108              - /metrics endpoint on a background thread
+#                                          (bound to HEART_METRICS_HOST, default 127.0.0.1;
+#                                          when several processes share the port, only
+#                                          the first serves it, the others log a warning)
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+METRICS_FILE = os.environ.get("HEART_METRICS_FILE")
+METRICS_PORT = os.environ.get("HEART_METRICS_PORT")
+METRICS_HOST = os.environ.get("HEART_METRICS_HOST", "127.0.0.1")
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RECENT_SAMPLES = 2048
+PREFIX = "heart_"
+
+logger = logging.getLogger(__name__)
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, seconds):
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.total += seconds
+        self.count += 1
+        self.recent.append(seconds)
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = _Histogram()
+            self._histograms[key].observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def summary(self):
+        # Recent-window percentiles in milliseconds, one row per histogram
+        rows = []
+        with self._lock:
+            items = [(key, list(h.recent), h.count) for key, h in self._histograms.items()]
+        for (name, labels), recent, count in sorted(items):
+            ms = np.array(recent) * 1000
+            row = {'metric': name, **dict(labels), 'count': count}
+            row.update({f'p{q}_ms': float(np.percentile(ms, q)) for q in (50, 95, 99)})
+            rows.append(row)
+        return rows
+
+    def counters(self):
+        with self._lock:
+            values = dict(self._counters)
+            values.update(self._gauges)
+        return {name + _format_labels(labels): v for (name, labels), v in sorted(values.items())}
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(self._histograms.items())
+        for kind, series in (("counter", counters), ("gauge", gauges)):
+            declared = set()
+            for (name, labels), value in series:
+                if name not in declared:
+                    lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                    declared.add(name)
+                lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+        declared = set()
+        for (name, labels), h in histograms:
+            if name not in declared:
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                declared.add(name)
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ("+Inf",), h.counts):
+                cumulative += n
+                lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {h.total}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path=None):
+        path = path or METRICS_FILE
+        if not path:
+            return
+        # Write-then-rename so a scraper never reads a half-written file
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+metrics = Metrics()
+
+
+def stage(name):
+    # Times one step of the prediction path as heart_stage_seconds{stage=name}
+    return metrics.timer("stage_seconds", stage=name)
+
+
+_http_server = None
+_http_error = None
+_http_lock = threading.Lock()
+
+
+def start_http_exporter(port=None):
+    # Serves GET /metrics once per process; no-op without a port. A port that
+    # can't be bound is logged once and never retried, so metrics export
+    # can't take the app down
+    global _http_server, _http_error
+    port = port or METRICS_PORT
+    if not port:
+        return None
+    with _http_lock:
+        if _http_server is not None or _http_error is not None:
+            return _http_server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            _http_server = ThreadingHTTPServer((METRICS_HOST, int(port)), Handler)
+        except (OSError, ValueError) as e:
+            _http_error = e
+            logger.warning("Not serving /metrics on %s:%s: %s", METRICS_HOST, port, e)
+            return None
+        threading.Thread(target=_http_server.serve_forever, daemon=True).start()
+        return _http_server
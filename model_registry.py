@@ -0,0 +1,135 @@
+# --- Versioned model registry ---
+#
+# A directory of trained models plus a manifest naming the active one and,
+# optionally, a candidate to shadow-score:
+#
+#   models/manifest.json
+#   models/<version>/<model_id>            (+ .native.json / .native.bin)
+#
+#   {"active": "v2", "candidate": "v3",
+#    "versions": {"v2": {"model_path": "v2/GBM_...", "registered_at": ..., "metrics": {...}}, ...}}
+#
+# train_model.py registers (and by default activates) every run. Running apps
+# poll the manifest and swap to a new active version without a restart, see
+# scoring.ModelService. From the command line:
+#
+#   python model_registry.py list
+#   python model_registry.py activate v3
+#   python model_registry.py candidate v4        (or --clear)
+
+import argparse
+import json
+import os
+import time
+
+MODELS_DIR = os.environ.get("HEART_MODELS_DIR", "models")
+MANIFEST_NAME = "manifest.json"
+
+
+class ModelRegistry:
+    def __init__(self, root=MODELS_DIR):
+        self.root = root
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+
+    def read(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {}
+        manifest.setdefault('active', None)
+        manifest.setdefault('candidate', None)
+        manifest.setdefault('versions', {})
+        return manifest
+
+    def signature(self):
+        # Changes whenever the manifest is rewritten; cheap enough to poll
+        try:
+            st = os.stat(self.manifest_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _write(self, manifest):
+        # Write-then-rename: readers see the old manifest or the new one,
+        # never a partial file
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def model_path(self, version, manifest=None):
+        manifest = manifest or self.read()
+        if version not in manifest['versions']:
+            raise KeyError(f"Unknown model version '{version}'")
+        return os.path.join(self.root, manifest['versions'][version]['model_path'])
+
+    def active_path(self, manifest=None):
+        manifest = manifest or self.read()
+        return self.model_path(manifest['active'], manifest) if manifest['active'] else None
+
+    def candidate_path(self, manifest=None):
+        manifest = manifest or self.read()
+        return self.model_path(manifest['candidate'], manifest) if manifest['candidate'] else None
+
+    def register(self, version, model_path, metrics=None, activate=False):
+        manifest = self.read()
+        manifest['versions'][version] = {
+            'model_path': os.path.relpath(model_path, self.root),
+            'registered_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            'metrics': metrics or {},
+        }
+        if activate:
+            manifest['active'] = version
+        self._write(manifest)
+
+    def activate(self, version):
+        manifest = self.read()
+        self.model_path(version, manifest)
+        manifest['active'] = version
+        if manifest['candidate'] == version:
+            manifest['candidate'] = None
+        self._write(manifest)
+
+    def set_candidate(self, version):
+        manifest = self.read()
+        if version is not None:
+            self.model_path(version, manifest)
+        manifest['candidate'] = version
+        self._write(manifest)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the versioned model registry.")
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="Show registered versions")
+    p_act = sub.add_parser("activate", help="Make a version the active model")
+    p_act.add_argument("version")
+    p_cand = sub.add_parser("candidate", help="Shadow-score a version next to the active model")
+    p_cand.add_argument("version", nargs="?")
+    p_cand.add_argument("--clear", action="store_true", help="Stop shadow scoring")
+    args = parser.parse_args(argv)
+
+    registry = ModelRegistry(args.models_dir)
+    try:
+        if args.command == "activate":
+            registry.activate(args.version)
+        elif args.command == "candidate":
+            if not args.clear and not args.version:
+                parser.error("give a version or --clear")
+            registry.set_candidate(None if args.clear else args.version)
+    except KeyError as e:
+        parser.exit(1, f"{e.args[0]}\n")
+
+    manifest = registry.read()
+    for version, entry in sorted(manifest['versions'].items()):
+        role = "active" if version == manifest['active'] else "candidate" if version == manifest['candidate'] else ""
+        auc = entry.get('metrics', {}).get('test', {}).get('auc')
+        auc = f"AUC {auc:.4f}" if auc is not None else ""
+        print(f"{version:<20}{role:<11}{auc:<12}{entry['model_path']}")
+
+
+if __name__ == "__main__":
+    main()
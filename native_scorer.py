@@ -0,0 +1,419 @@
+# --- JVM-free scoring of the exported H2O GBM with NumPy ---
+#
+# The H2O model is exported once into a JSON tree dump (see `export_model`);
+# after that the ensemble is evaluated in-process without Java.
+#
+# Tolerance: p1 matches `loaded_model.predict(...)['p1']` to within
+# NATIVE_TOLERANCE (absolute). Leaf values and split thresholds are the float32
+# values H2O stores, so the only difference is the order of the float sums.
+# The export step measures the actual error on synthetic patients and records
+# it in the artifact under "verification".
+#
+# Internal node values: H2O's tree dump gives internal nodes values that are
+# not the mean of their subtree (roots are 0.0, and some lie outside both
+# children), and the path attribution in contributions_encoded is only
+# meaningful on means. So the export replaces them with cover-weighted means
+# of their children, bottom-up, with covers counted from the training rows
+# (or COVER_ROWS patients drawn from the training marginals, not uniformly:
+# covers from off-distribution rows shift every contribution away from
+# TreeSHAP's). Leaves, and therefore p1, are untouched. The contributions
+# are checked against H2O's TreeSHAP the same way p1 is.
+#
+# For serving, the JSON dump is compiled into a flat file (`.native.bin`): a
+# small JSON header followed by the node table as contiguous little-endian
+# arrays. `load_flat` memory-maps it read-only, so the arrays are used in
+# place without parsing, and every worker process on a host shares the same
+# page-cache copy.
+
+import json
+import os
+import sys
+
+import numpy as np
+
+from patient_fields import FEATURE_COLUMNS, random_patients, reference_patients
+
+ARTIFACT_FORMAT = 1
+NATIVE_TOLERANCE = 1e-6
+# Rows drawn from the training marginals for node covers when no training
+# data is given
+COVER_ROWS = 20000
+# Allowed share of driver-sized contributions (|c| >= CONTRIBUTION_MIN_DRIVER)
+# whose sign differs from H2O's TreeSHAP, over all features
+CONTRIBUTION_MIN_DRIVER = 0.1
+CONTRIBUTION_SIGN_TOLERANCE = 0.1
+
+FLAT_FORMAT = 1
+FLAT_MAGIC = b"HDGBMBIN"
+FLAT_ALIGN = 64
+# Node table layout, in file order
+FLAT_ARRAYS = [
+    ('feature', '<i4'), ('threshold', '<f8'), ('left', '<i4'), ('right', '<i4'),
+    ('na_left', '|b1'), ('left_mask', '<i8'), ('value', '<f8'), ('roots', '<i4'),
+]
+
+
+def artifact_path_for(model_path):
+    return model_path + ".native.json"
+
+
+def flat_path_for(model_path):
+    return model_path + ".native.bin"
+
+
+# --- Export (needs H2O, run once) ---
+def _export_tree(tree, feature_index, domains):
+    n = len(tree.left_children)
+    nodes = {
+        'feature': [-1] * n, 'threshold': [0.0] * n, 'left': [-1] * n,
+        'right': [-1] * n, 'na_left': [True] * n, 'left_mask': [0] * n,
+        'value': [float(v) for v in tree.predictions],
+    }
+    for i in range(n):
+        left, right = tree.left_children[i], tree.right_children[i]
+        if left < 0:
+            continue
+        name = tree.features[i]
+        nodes['feature'][i] = feature_index[name]
+        nodes['left'][i] = left
+        nodes['right'][i] = right
+        # H2O reports the NA direction as LEFT/RIGHT, or None when the split
+        # never saw missing values (those go left at scoring time)
+        nodes['na_left'][i] = tree.nas[i] != 'RIGHT'
+        if domains[name] is not None:
+            # Categorical split: the left child lists the levels routed to it
+            mask = 0
+            for level in tree.levels[left] or []:
+                mask |= 1 << domains[name].index(level)
+            nodes['left_mask'][i] = mask
+        else:
+            nodes['threshold'][i] = float(tree.thresholds[i])
+    return nodes
+
+
+def cover_weighted_values(artifact, reference=None, source="training_marginals"):
+    # Rewrites the artifact's internal node values as cover-weighted child
+    # means (see the top of the file); `reference` is patient dicts or a
+    # DataFrame, COVER_ROWS reference_patients by default
+    if reference is None:
+        reference = reference_patients(COVER_ROWS, seed=4321)
+    model = NativeGBM(artifact)
+    cover = np.bincount(model.leaves(model.encode(reference)).ravel(), minlength=model.value.size).astype(float)
+    value = model.value.copy()
+    levels, frontier = [], model.roots
+    while frontier.size:
+        frontier = frontier[model.feature[frontier] >= 0]
+        levels.append(frontier)
+        frontier = np.concatenate([model.left[frontier], model.right[frontier]])
+    # Deepest level first, so both children are final before their parent
+    for nodes in reversed(levels):
+        left, right = model.left[nodes], model.right[nodes]
+        cover[nodes] = cover[left] + cover[right]
+        # A node no reference row reaches gets the plain mean of its children
+        weight = np.where(cover[nodes] > 0, cover[left] / np.maximum(cover[nodes], 1), 0.5)
+        value[nodes] = weight * value[left] + (1 - weight) * value[right]
+    for tree, root in zip(artifact['trees'], model.roots):
+        n = len(tree['value'])
+        tree['value'] = value[root:root + n].tolist()
+    artifact['node_values'] = {'method': 'cover_mean', 'reference': source, 'rows': len(reference)}
+    return artifact
+
+
+def export_model(model, out_path, verify_rows=500, reference=None):
+    from h2o.tree import H2OTree
+
+    output = model._model_json['output']
+    if output['model_category'] != 'Binomial':
+        raise ValueError(f"Only binomial GBMs are supported, got {output['model_category']}")
+    names = output['names'][:-1]
+    domains = dict(zip(names, output['domains'][:-1]))
+    for name, domain in domains.items():
+        if domain is not None and len(domain) > 63:
+            raise ValueError(f"Column {name} has too many levels for a split mask")
+    feature_index = {name: i for i, name in enumerate(names)}
+
+    ntrees = int(output['model_summary']['number_of_trees'][0])
+    trees = [_export_tree(H2OTree(model, t), feature_index, domains) for t in range(ntrees)]
+    artifact = {
+        'format': ARTIFACT_FORMAT,
+        'model_id': model.model_id,
+        'init_f': float(output['init_f']),
+        'features': [{'name': name, 'domain': domains[name]} for name in names],
+        'trees': trees,
+    }
+    cover_weighted_values(artifact, reference, "training_marginals" if reference is None else "training")
+
+    patients = random_patients(verify_rows, seed=1234)
+    native_model = NativeGBM(artifact)
+    native = native_model.predict(patients)
+    max_err = float(np.max(np.abs(native - h2o_predict(model, patients))))
+    artifact['verification'] = {'rows': verify_rows, 'max_abs_error': max_err,
+                                'tolerance': NATIVE_TOLERANCE}
+    if max_err > NATIVE_TOLERANCE:
+        raise ValueError(f"Native scorer differs from H2O by {max_err:.3g} (> {NATIVE_TOLERANCE})")
+
+    # Contributions: per-feature mean |difference| and, among driver-sized
+    # contributions, the share whose sign differs from TreeSHAP
+    native_c = native_model.contributions_encoded(native_model.encode(patients))[:, :-1]
+    h2o_c = h2o_contributions(model, patients)[:, :-1]
+    drivers = np.abs(h2o_c) >= CONTRIBUTION_MIN_DRIVER
+    flipped = drivers & (np.sign(native_c) != np.sign(h2o_c))
+    sign_err = float(flipped.sum() / max(drivers.sum(), 1))
+    artifact['verification']['contributions'] = {
+        'sign_disagreement': sign_err, 'tolerance': CONTRIBUTION_SIGN_TOLERANCE,
+        'mean_abs_diff': dict(zip(names, np.abs(native_c - h2o_c).mean(axis=0).round(4).tolist())),
+    }
+    if sign_err > CONTRIBUTION_SIGN_TOLERANCE:
+        raise ValueError(f"Native contributions disagree in sign with H2O's on {sign_err:.1%} of drivers "
+                         f"(> {CONTRIBUTION_SIGN_TOLERANCE:.0%})")
+
+    with open(out_path, "w") as f:
+        json.dump(artifact, f)
+    return artifact
+
+
+def h2o_predict(model, patients):
+    import h2o
+    import pandas as pd
+    from patient_fields import CATEGORICAL_COLUMNS
+
+    hf = h2o.H2OFrame(pd.DataFrame(patients, columns=FEATURE_COLUMNS))
+    for c in CATEGORICAL_COLUMNS:
+        hf[c] = hf[c].asfactor()
+    pred = model.predict(hf)
+    return np.asarray(pred['p1'].as_data_frame(use_pandas=False, header=False), dtype=float).ravel()
+
+
+def h2o_contributions(model, patients):
+    # TreeSHAP, columns FEATURE_COLUMNS + BiasTerm
+    import h2o
+    import pandas as pd
+    from patient_fields import CATEGORICAL_COLUMNS
+
+    hf = h2o.H2OFrame(pd.DataFrame(patients, columns=FEATURE_COLUMNS))
+    for c in CATEGORICAL_COLUMNS:
+        hf[c] = hf[c].asfactor()
+    contrib = model.predict_contributions(hf)
+    order = [contrib.columns.index(c) for c in FEATURE_COLUMNS + ['BiasTerm']]
+    values = np.asarray(contrib.as_data_frame(use_pandas=False, header=False), dtype=float)
+    return values.reshape(-1, len(contrib.columns))[:, order]
+
+
+# --- Scoring ---
+def _align(n):
+    return -(-n // FLAT_ALIGN) * FLAT_ALIGN
+
+
+class NativeGBM:
+    def __init__(self, artifact):
+        if artifact.get('format') != ARTIFACT_FORMAT:
+            raise ValueError(f"Unsupported native model format: {artifact.get('format')}")
+
+        # Flatten every tree into one node table; child ids become global offsets
+        feature, threshold, left, right, na_left, left_mask, value, roots = ([] for _ in range(8))
+        offset = 0
+        for tree in artifact['trees']:
+            n = len(tree['feature'])
+            roots.append(offset)
+            feature.extend(tree['feature'])
+            threshold.extend(tree['threshold'])
+            left.extend(c + offset if c >= 0 else -1 for c in tree['left'])
+            right.extend(c + offset if c >= 0 else -1 for c in tree['right'])
+            na_left.extend(tree['na_left'])
+            left_mask.extend(tree['left_mask'])
+            value.extend(tree['value'])
+            offset += n
+        arrays = {
+            'feature': np.array(feature, dtype=np.int32),
+            'threshold': np.array(threshold, dtype=np.float32).astype(np.float64),
+            'left': np.array(left, dtype=np.int32),
+            'right': np.array(right, dtype=np.int32),
+            'na_left': np.array(na_left, dtype=bool),
+            'left_mask': np.array(left_mask, dtype=np.int64),
+            'value': np.array(value, dtype=np.float32).astype(np.float64),
+            'roots': np.array(roots, dtype=np.int32),
+        }
+        self._set_model(artifact['model_id'], artifact['init_f'], artifact['features'], arrays)
+
+    def _set_model(self, model_id, init_f, features, arrays, max_depth=None):
+        self.model_id = model_id
+        self.init_f = init_f
+        self.features = features
+        self.feature_names = [f['name'] for f in features]
+        self.domains = [f['domain'] for f in features]
+        self.is_categorical = np.array([d is not None for d in self.domains])
+        self._level_codes = [
+            {level: code for code, level in enumerate(d)} if d is not None else None
+            for d in self.domains
+        ]
+        for name, _ in FLAT_ARRAYS:
+            setattr(self, name, arrays[name])
+        self.max_depth = self._max_depth() if max_depth is None else max_depth
+
+    @classmethod
+    def load(cls, path):
+        if path.endswith(".bin"):
+            return cls.load_flat(path)
+        with open(path) as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def load_flat(cls, path):
+        # Arrays are read-only views into the mapped file, nothing is copied
+        raw = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(raw[:len(FLAT_MAGIC)]) != FLAT_MAGIC:
+            raise ValueError(f"{path} is not a flat native model")
+        header_len = int(np.frombuffer(raw, '<u8', 1, len(FLAT_MAGIC))[0])
+        start = len(FLAT_MAGIC) + 8
+        header = json.loads(bytes(raw[start:start + header_len]))
+        if header['format'] != FLAT_FORMAT:
+            raise ValueError(f"Unsupported flat model format: {header['format']}")
+        data_start = _align(start + header_len)
+        arrays = {name: np.frombuffer(raw, dtype, count, data_start + offset)
+                  for name, (dtype, offset, count) in header['arrays'].items()}
+        model = cls.__new__(cls)
+        model._set_model(header['model_id'], header['init_f'], header['features'], arrays, header['max_depth'])
+        return model
+
+    def save_flat(self, path):
+        # [magic][header length: u8][JSON header][pad][arrays, each 64-byte aligned]
+        header = {
+            'format': FLAT_FORMAT, 'model_id': self.model_id, 'init_f': self.init_f,
+            'features': self.features, 'max_depth': self.max_depth, 'arrays': {},
+        }
+        blobs, offset = [], 0
+        for name, dtype in FLAT_ARRAYS:
+            data = np.ascontiguousarray(getattr(self, name), dtype=dtype)
+            header['arrays'][name] = [dtype, offset, int(data.size)]
+            blobs.append(data.tobytes().ljust(_align(data.nbytes), b"\0"))
+            offset += _align(data.nbytes)
+        header_bytes = json.dumps(header).encode()
+        prefix = FLAT_MAGIC + np.array([len(header_bytes)], dtype='<u8').tobytes() + header_bytes
+
+        # Write-then-rename so a worker never maps a half-written file
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(prefix.ljust(_align(len(prefix)), b"\0"))
+            for blob in blobs:
+                f.write(blob)
+        os.replace(tmp, path)
+
+    def _max_depth(self):
+        depth, frontier = 0, self.roots
+        while True:
+            frontier = frontier[self.feature[frontier] >= 0]
+            if frontier.size == 0:
+                return depth
+            frontier = np.concatenate([self.left[frontier], self.right[frontier]])
+            depth += 1
+
+    def encode(self, patients):
+        # Patient dicts (or a DataFrame) -> float matrix; categoricals become
+        # level codes, unknown levels and missing values become NaN
+        if hasattr(patients, 'to_dict'):
+            columns = {name: list(patients[name]) for name in self.feature_names}
+            n = len(patients)
+        else:
+            n = len(patients)
+            columns = {name: [p.get(name) for p in patients] for name in self.feature_names}
+        X = np.full((n, len(self.feature_names)), np.nan)
+        for j, name in enumerate(self.feature_names):
+            codes = self._level_codes[j]
+            if codes is None:
+                X[:, j] = np.array(columns[name], dtype=float)
+            else:
+                X[:, j] = [codes.get(v, np.nan) for v in columns[name]]
+        return X
+
+    def leaves(self, X):
+        return self._walk(X)
+
+    def _walk(self, X, contributions=None):
+        # Walk all (row, tree) pairs down together, one level per iteration.
+        # With `contributions` (n_rows x n_features), each step also adds the
+        # change in node value to the feature that was split on
+        n, n_features = X.shape
+        node = np.tile(self.roots, (n, 1))
+        rows = np.arange(n)[:, None]
+        for _ in range(self.max_depth):
+            feat = self.feature[node]
+            split = feat >= 0
+            if not split.any():
+                break
+            x = X[rows, np.maximum(feat, 0)]
+            missing = np.isnan(x)
+            codes = np.where(missing, 0, x).astype(np.int64)
+            go_left = np.where(
+                self.is_categorical[np.maximum(feat, 0)],
+                (self.left_mask[node] >> codes) & 1 == 1,
+                x < self.threshold[node],
+            )
+            go_left = np.where(missing, self.na_left[node], go_left)
+            child = np.where(split, np.where(go_left, self.left[node], self.right[node]), node)
+            if contributions is not None:
+                flat = (rows * n_features + np.maximum(feat, 0)).ravel()
+                delta = (self.value[child] - self.value[node]).ravel()
+                contributions += np.bincount(flat, delta, n * n_features).reshape(n, n_features)
+            node = child
+        return node
+
+    def contributions_encoded(self, X):
+        # Path attribution (Saabas): every split credits its feature with the
+        # change in node value along the row's path, and the last column is
+        # init_f plus the root values (the mean logit over the covers). Rows
+        # sum exactly to the log-odds. Node values are cover-weighted means
+        # (see cover_weighted_values); H2O's predict_contributions is
+        # TreeSHAP, so the two can differ per feature while agreeing on the
+        # total.
+        n, n_features = X.shape
+        by_feature = np.zeros((n, n_features))
+        self._walk(X, by_feature)
+        bias = np.full((n, 1), self.init_f + self.value[self.roots].sum())
+        return np.hstack([by_feature, bias])
+
+    def decision_function(self, X):
+        return self.init_f + self.value[self.leaves(X)].sum(axis=1)
+
+    def predict_encoded(self, X):
+        return 1.0 / (1.0 + np.exp(-self.decision_function(X)))
+
+    def predict(self, patients):
+        # Probability of heart disease (H2O's p1) for each patient
+        return self.predict_encoded(self.encode(patients))
+
+    def explain(self, patients):
+        # (p1, contributions) from a single walk of the trees
+        contributions = self.contributions_encoded(self.encode(patients))
+        return 1.0 / (1.0 + np.exp(-contributions.sum(axis=1))), contributions
+
+
+# --- CLI ---
+#   python native_scorer.py [model_path] [out_path]   export from H2O (+ flat file)
+#   python native_scorer.py --flat [model_path]       compile the flat file from
+#                                                     an existing JSON dump, no H2O
+#                                                     (dumps exported before cover-
+#                                                     weighted node values get them)
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    flat_only = "--flat" in args
+    args = [a for a in args if a != "--flat"]
+    model_path = args[0] if args else "GBM_grid_1_AutoML_1_20250730_201105_model_4"
+    out_path = args[1] if len(args) > 1 else artifact_path_for(model_path)
+    if flat_only:
+        with open(out_path) as f:
+            artifact = json.load(f)
+        if 'node_values' not in artifact:
+            cover_weighted_values(artifact)
+            with open(out_path, "w") as f:
+                json.dump(artifact, f)
+            print(f"Rewrote the internal node values of {out_path} as cover-weighted means")
+    if not flat_only:
+        import h2o
+
+        h2o.init(strict_version_check=False)
+        model = h2o.load_model(os.path.abspath(model_path))
+        artifact = export_model(model, out_path)
+        print(f"Exported {len(artifact['trees'])} trees to {out_path} "
+              f"(max |p1 - H2O p1| = {artifact['verification']['max_abs_error']:.3g})")
+    NativeGBM.load(out_path).save_flat(flat_path_for(model_path))
+    print(f"Wrote {flat_path_for(model_path)} ({os.path.getsize(flat_path_for(model_path))} bytes)")
@@ -0,0 +1,147 @@
+# --- Patient input fields shared by the app, the scorers and offline tools ---
+
+# --- Feature explanations ---
+feature_info = {
+    "ATA": "**Typical Angina (ATA)** 🫀: Classic chest pain with exertion, relieved by rest.",
+    "NAP": "**Non-Anginal Pain (NAP)** 💭: Chest pain not typical of heart disease.",
+    "ASY": "**Asymptomatic (ASY)** 😌: No chest pain symptoms.",
+    "TA": "**Atypical Angina (TA)** 🤔: Chest pain not classic but may indicate heart issues.",
+    "ExerciseAngina": "**Exercise Induced Angina** 🏃‍♀️: Chest pain with exercise.",
+    "FastingBS": "**Fasting Blood Sugar** 🍬: >120 mg/dl may signal diabetes.",
+    "ChestPainType": "**Types of Chest Pain** 💔: Helps differentiate heart-related pain.",
+    "Age": "**Age** 🎂: Risk increases with age.",
+    "Sex": "**Biological Sex** ⚧️: Men develop heart disease earlier.",
+    "RestingBP": "**Resting Blood Pressure** 🩺: Normal <120/80 mmHg.",
+    "Cholesterol": "**Cholesterol** 🧪: High levels clog arteries.",
+    "RestingECG": "**Resting ECG** 📈: Heart electrical activity at rest.",
+    "MaxHR": "**Max Heart Rate** ❤️‍🔥: Highest during exercise.",
+    "Oldpeak": "**ST Depression** 📉: Electrical changes during exercise.",
+    "ST_Slope": "**ST Segment Slope** 📊: Up slope usually better."
+}
+
+# --- Required fields with prompts and validation ranges ---
+required_fields = [
+    ("Age", "What's your age? 🎂 (20-100)", (20, 100)),
+    ("Sex", "What's your biological sex? 👤 ('M' or 'F')", None),
+    ("ChestPainType", "Type of chest pain? 💔 (ATA, NAP, ASY, TA)\n(Type 'what is ATA' for details)", None),
+    ("RestingBP", "Resting blood pressure? 🩺 (90-200 mmHg, or 'unknown')", (90, 200)),
+    ("Cholesterol", "Cholesterol level? 🧪 (100-400 mg/dl, or 'unknown')", (0, 600)),
+    ("FastingBS", "Is fasting blood sugar >120 mg/dl? 🍬 (Yes/No/unknown)", None),
+    ("RestingECG", "Resting ECG result? 📈 (Normal, ST, LVH)\n(Default is 'Normal')", None),
+    ("MaxHR", "Maximum heart rate during exercise? ❤️‍🔥 (60-220 bpm; estimate 220-age if unknown)", (60, 220)),
+    ("ExerciseAngina", "Exercise-induced angina? 🏃‍♀️ (Yes or No)", None),
+    ("Oldpeak", "ST depression value? 📉 (0-6; 0 if unknown)", (0, 6)),
+    ("ST_Slope", "ST segment slope during exercise? 📊 (Up, Flat, Down)", None)
+]
+
+# Model input columns, in training order
+FEATURE_COLUMNS = [key for key, _, _ in required_fields]
+
+# Columns the model was trained on as factors (FastingBS stays numeric 0/1)
+CATEGORICAL_COLUMNS = ['Sex', 'ChestPainType', 'RestingECG', 'ExerciseAngina', 'ST_Slope']
+
+INTEGER_COLUMNS = ['Age', 'RestingBP', 'Cholesterol', 'MaxHR']
+
+# Allowed values for every non-range field
+CATEGORY_OPTIONS = {
+    'Sex': ['M', 'F'],
+    'ChestPainType': ['ATA', 'NAP', 'ASY', 'TA'],
+    'FastingBS': [0, 1],
+    'RestingECG': ['Normal', 'ST', 'LVH'],
+    'ExerciseAngina': ['N', 'Y'],
+    'ST_Slope': ['Up', 'Flat', 'Down'],
+}
+
+# --- Accepted answers ---
+# Spellings of each option, matched case-insensitively: as a whole value in
+# forms and files, or as a phrase inside a chat message
+YES_WORDS = ['yes', 'y', 'yeah', 'yep', 'yup', '1', 'true', 'positive']
+NO_WORDS = ['no', 'n', 'nope', 'nah', '0', 'false', 'negative', 'never', 'not really']
+# Answers that mean "use the default"
+UNKNOWN_PHRASES = ['unknown', 'not sure', "don't know", 'dont know', 'do not know', 'no idea', 'idk']
+
+OPTION_ALIASES = {
+    'Sex': {'M': ['m', 'male', 'man'], 'F': ['f', 'female', 'woman']},
+    'ChestPainType': {
+        'ATA': ['ata', 'typical angina', 'typical'],
+        'NAP': ['nap', 'non-anginal', 'non anginal', 'nonanginal'],
+        'ASY': ['asy', 'asymptomatic', 'none', 'no pain'],
+        'TA': ['ta', 'atypical angina', 'atypical'],
+    },
+    'FastingBS': {1: YES_WORDS, 0: NO_WORDS},
+    'RestingECG': {'Normal': ['normal'], 'ST': ['st', 'st-t'], 'LVH': ['lvh']},
+    'ExerciseAngina': {'Y': YES_WORDS, 'N': NO_WORDS},
+    'ST_Slope': {'Up': ['up', 'upsloping', 'upward'], 'Flat': ['flat'], 'Down': ['down', 'downsloping', 'downward']},
+}
+
+PATIENT_DEFAULTS = {
+    'Age': 50, 'Sex': 'M', 'ChestPainType': 'ASY', 'RestingBP': 120,
+    'Cholesterol': 200, 'FastingBS': 0, 'RestingECG': 'Normal',
+    'MaxHR': 150, 'ExerciseAngina': 'N', 'Oldpeak': 1.0, 'ST_Slope': 'Up'
+}
+
+
+def build_patient_info(user_dict):
+    info = {}
+    for k, default in PATIENT_DEFAULTS.items():
+        info[k] = user_dict.get(k, default)
+    return info
+
+
+def random_patients(n, seed=0):
+    # Synthetic patients drawn uniformly from the declared ranges and options
+    import random
+    rng = random.Random(seed)
+    patients = []
+    for _ in range(n):
+        info = {}
+        for key, _, vrange in required_fields:
+            if key in CATEGORY_OPTIONS:
+                info[key] = rng.choice(CATEGORY_OPTIONS[key])
+            elif key in INTEGER_COLUMNS:
+                info[key] = rng.randint(vrange[0], vrange[1])
+            else:
+                info[key] = round(rng.uniform(vrange[0], vrange[1]), 1)
+        patients.append(info)
+    return patients
+
+
+# --- Training-set marginals ---
+# The Kaggle heart.csv the bundled model was trained on (918 rows, see
+# df.describe() in Project.ipynb): counts per option, and for numbers the
+# share of zeros (Cholesterol is 0 when not measured) plus the mean, sd and
+# range of the non-zero values
+TRAINING_COUNTS = {
+    'Sex': {'M': 725, 'F': 193},
+    'ChestPainType': {'ASY': 496, 'NAP': 203, 'ATA': 173, 'TA': 46},
+    'FastingBS': {0: 704, 1: 214},
+    'RestingECG': {'Normal': 552, 'LVH': 188, 'ST': 178},
+    'ExerciseAngina': {'N': 547, 'Y': 371},
+    'ST_Slope': {'Flat': 460, 'Up': 395, 'Down': 63},
+}
+TRAINING_NUMBERS = {
+    # key: (zero share, mean, sd, min, max)
+    'Age': (0.0, 53.5, 9.4, 28, 77),
+    'RestingBP': (0.0, 132.4, 18.5, 90, 200),
+    'Cholesterol': (0.187, 244.6, 59.4, 85, 603),
+    'MaxHR': (0.0, 136.8, 25.5, 60, 202),
+    'Oldpeak': (0.401, 1.48, 1.01, 0.1, 6.0),
+}
+
+
+def reference_patients(n, seed=0):
+    # Synthetic patients drawn from the training marginals above, each
+    # feature independently; a stand-in for the training rows when those
+    # aren't at hand
+    import random
+    rng = random.Random(seed)
+    patients = []
+    for _ in range(n):
+        info = {}
+        for key, counts in TRAINING_COUNTS.items():
+            info[key] = rng.choices(list(counts), weights=list(counts.values()))[0]
+        for key, (zeros, mean, sd, lo, hi) in TRAINING_NUMBERS.items():
+            value = 0 if rng.random() < zeros else min(max(rng.gauss(mean, sd), lo), hi)
+            info[key] = int(round(value)) if key in INTEGER_COLUMNS else round(value, 1)
+        patients.append({key: info[key] for key, _, _ in required_fields})
+    return patients
@@ -0,0 +1,155 @@
+# --- Declarative patient schema shared by the chat, the form and batch files ---
+#
+# Compiled once from required_fields and the declarations next to it
+# (CATEGORY_OPTIONS, OPTION_ALIASES, INTEGER_COLUMNS, PATIENT_DEFAULTS), so
+# every entry point accepts the same spellings, applies the same ranges and
+# falls back to the same defaults:
+#
+#   SCHEMA.parse(key, value)     one answer       -> (value, None) or (None, error)
+#   SCHEMA.validate(values)      a whole form     -> (patient_info, {key: error})
+#   SCHEMA.validate_frame(df)    a table of rows  -> (patients, per-row error Series)
+#
+# A blank, NaN or "unknown"-style answer means "use the default". Frames are
+# validated column by column on each column's distinct values (pd.factorize),
+# so a chunk of 10k rows costs a few hundred string operations, not 10k.
+
+import math
+from collections import namedtuple
+
+from patient_fields import (CATEGORY_OPTIONS, INTEGER_COLUMNS, OPTION_ALIASES, PATIENT_DEFAULTS,
+                            UNKNOWN_PHRASES, YES_WORDS, required_fields)
+
+# aliases maps every accepted lower-case spelling to its option; range is
+# None for option fields; expected completes "<key> must be ..."
+Field = namedtuple('Field', ['key', 'prompt', 'range', 'options', 'aliases', 'integer', 'default', 'expected'])
+
+MISSING_TEXT = frozenset(['', 'nan', 'null', 'n/a'] + UNKNOWN_PHRASES)
+
+
+def _normalize(value):
+    # "  Yes " -> "yes", 1.0 / "1.0" -> "1"
+    text = str(value).strip().lower()
+    return text[:-2] if text.endswith('.0') else text
+
+
+def _is_missing(value):
+    if value is None:
+        return True
+    if isinstance(value, float) and math.isnan(value):
+        return True
+    return isinstance(value, str) and value.strip().lower() in MISSING_TEXT
+
+
+def _expected(key, options, vrange):
+    if options is None:
+        return f"a number between {vrange[0]} and {vrange[1]}"
+    if any(words is YES_WORDS for words in OPTION_ALIASES.get(key, {}).values()):
+        return "'Yes', 'No' or 'unknown'"
+    return "one of " + ", ".join(map(str, options))
+
+
+class PatientSchema:
+    def __init__(self, required_fields):
+        self.fields = {}
+        for key, prompt, vrange in required_fields:
+            options = CATEGORY_OPTIONS.get(key)
+            aliases = None
+            if options is not None:
+                aliases = {_normalize(option): option for option in options}
+                for option, words in OPTION_ALIASES.get(key, {}).items():
+                    aliases.update((word, option) for word in words)
+            self.fields[key] = Field(key, prompt, None if options else vrange, options, aliases,
+                                     key in INTEGER_COLUMNS, PATIENT_DEFAULTS[key],
+                                     _expected(key, options, vrange))
+        self.keys = list(self.fields)
+        self.defaults = {key: field.default for key, field in self.fields.items()}
+
+    def error(self, key):
+        return f"{key} must be {self.fields[key].expected}"
+
+    def check(self, key, value):
+        # An already-parsed value: (value, None) or (None, error). Numbers are
+        # range checked and integer fields truncated, like int() in the chat.
+        field = self.fields[key]
+        if field.options is not None:
+            return (value, None) if value in field.options else (None, self.error(key))
+        if not field.range[0] <= value <= field.range[1]:
+            return None, self.error(key)
+        return (int(value), None) if field.integer else (float(value), None)
+
+    def parse(self, key, value):
+        # One raw answer (form widget, cell, API field); missing -> default
+        field = self.fields[key]
+        if _is_missing(value):
+            return field.default, None
+        if field.options is not None:
+            option = field.aliases.get(_normalize(value))
+            return (option, None) if option is not None else (None, self.error(key))
+        if isinstance(value, str):
+            try:
+                value = float(value.strip().replace(',', '.'))
+            except ValueError:
+                return None, self.error(key)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or math.isnan(value):
+            return None, self.error(key)
+        return self.check(key, value)
+
+    def validate(self, values):
+        # A whole record: (patient_info with defaults filled in, {key: error})
+        info, errors = {}, {}
+        for key in self.keys:
+            value, error = self.parse(key, values.get(key))
+            if error:
+                errors[key] = error
+            info[key] = value if error is None else self.fields[key].default
+        return info, errors
+
+    def validate_frame(self, df):
+        # (patients, errors): the model columns with defaults filled in, and a
+        # per-row '; '-joined error message ('' when the row is valid).
+        # Invalid cells get the default too, so every chunk has the same
+        # column dtypes; the raw value is quoted in the message instead.
+        # Rows with an error must not be scored
+        import numpy as np
+        import pandas as pd
+
+        patients = pd.DataFrame(index=df.index)
+        errors = np.full(len(df), '', dtype=object)
+        for key, field in self.fields.items():
+            if key not in df.columns:
+                patients[key] = field.default
+                continue
+            # Work on the distinct values, NaN (code -1) as one more of them
+            codes, uniques = pd.factorize(df[key], use_na_sentinel=True)
+            codes = np.where(codes < 0, len(uniques), codes)
+            raw = np.array(list(uniques) + [None], dtype=object)
+            text = pd.Series(raw[:-1].tolist() + [''], dtype=object).astype(str).str.strip().str.lower()
+            missing = text.isin(MISSING_TEXT).to_numpy()
+            parsed = np.empty(len(raw), dtype=object)
+            if field.options is not None:
+                options = text.str.replace(r'\.0$', '', regex=True).map(field.aliases)
+                bad = options.isna().to_numpy() & ~missing
+                good = ~(missing | bad)
+                values = options.to_numpy(dtype=object)[good]
+                parsed[good] = values if isinstance(field.options[0], str) else values.astype(int)
+            else:
+                numbers = pd.to_numeric(text.where(~missing).str.replace(',', '.', regex=False), errors='coerce')
+                numbers = numbers.to_numpy(dtype=float)
+                lo, hi = field.range
+                with np.errstate(invalid='ignore'):
+                    bad = ~missing & ~((numbers >= lo) & (numbers <= hi))
+                good = ~(missing | bad)
+                # Only in-range numbers are cast, so inf or 1e300 never reach int()
+                parsed[good] = numbers[good].astype(int) if field.integer else numbers[good]
+            parsed[missing | bad] = field.default
+            dtype = object if isinstance(field.default, str) else type(field.default)
+            patients[key] = pd.Series(parsed[codes], index=df.index, dtype=object).astype(dtype)
+            if bad.any():
+                messages = np.full(len(raw), '', dtype=object)
+                messages[bad] = [f"{self.error(key)} (got {value!r}); " for value in raw[bad]]
+                errors = errors + messages[codes]
+        errors = pd.Series(errors, index=df.index, dtype=object).str.rstrip('; ')
+        return patients, errors
+
+
+SCHEMA = PatientSchema(required_fields)
@@ -0,0 +1,99 @@
+# --- Bounded LRU cache of predictions keyed on the normalized patient ---
+#
+# After build_patient_info most patients share the same categorical values and
+# a handful of integers, and "New Assessment" often resubmits the same form, so
+# the same 11-field vector gets scored over and over. Entries are dropped when
+# any watched model file changes on disk or the service swaps models.
+
+import os
+import threading
+from collections import OrderedDict
+
+from patient_fields import CATEGORY_OPTIONS, FEATURE_COLUMNS, INTEGER_COLUMNS
+
+DEFAULT_CACHE_SIZE = 4096
+
+
+def patient_key(patient_info):
+    key = []
+    for name in FEATURE_COLUMNS:
+        value = patient_info[name]
+        if name in INTEGER_COLUMNS or name == 'FastingBS':
+            value = int(value)
+        elif name in CATEGORY_OPTIONS:
+            value = str(value)
+        else:
+            value = round(float(value), 6)
+        key.append(value)
+    return tuple(key)
+
+
+def _file_signature(paths):
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        signature.append((path, st.st_mtime_ns, st.st_size))
+    return tuple(signature)
+
+
+class PredictionCache:
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, watch_paths=()):
+        self.maxsize = maxsize
+        self.watch_paths = list(watch_paths)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._signature = _file_signature(self.watch_paths)
+        self._lock = threading.Lock()
+
+    def _check_files(self):
+        signature = _file_signature(self.watch_paths)
+        if signature != self._signature:
+            self._entries.clear()
+            self._signature = signature
+            self.invalidations += 1
+
+    def get(self, key):
+        with self._lock:
+            self._check_files()
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def watch(self, paths):
+        # Switch to another model's files and start over
+        with self._lock:
+            self.watch_paths = list(paths)
+            self._signature = _file_signature(self.watch_paths)
+            self._entries.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+        }
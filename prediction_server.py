@@ -0,0 +1,264 @@
+# --- Micro-batching prediction server shared by concurrent app sessions ---
+#
+# Single-row requests that arrive within a short window are scored together as
+# one batch, so N concurrent sessions cost one predict call instead of N
+# serialized ones on the JVM.
+#
+#   python prediction_server.py --port 8765 --window-ms 5 --max-batch 64
+#   HEART_SCORING_BACKEND=server HEART_PREDICTION_SERVER=127.0.0.1:8765 streamlit run app.py
+#
+# Protocol: newline-delimited JSON over TCP. A request is
+#   {"patients": [{...}, ...]}, optionally with "contributions": true and
+#   "shadow": true (live traffic, also queued for a candidate model),
+#   or {"ping": true}
+# and the reply is {"p1": [...]} (plus "contributions": [[...], ...] in
+# scoring.CONTRIBUTION_COLUMNS order) / {"pong": true}, or {"error": "..."}.
+
+import argparse
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WINDOW_MS = 5
+DEFAULT_MAX_BATCH = 64
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or DEFAULT_HOST, int(port)
+
+
+# --- Server ---
+class MicroBatcher:
+    def __init__(self, predict, window_ms=DEFAULT_WINDOW_MS, max_batch=DEFAULT_MAX_BATCH):
+        self.predict = predict
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.rows = 0
+        self._queue = asyncio.Queue()
+
+    async def submit(self, patients):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((patients, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self._queue.get()]
+            size = len(pending[0][0])
+            deadline = loop.time() + self.window
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                size += len(item[0])
+            await self._score(pending)
+
+    async def _score(self, pending):
+        rows = [patient for patients, _ in pending for patient in patients]
+        try:
+            # predict blocks (REST round trips or NumPy), keep it off the loop
+            scores = await asyncio.get_running_loop().run_in_executor(None, self.predict, rows)
+        except Exception as e:
+            if len(pending) == 1:
+                if not pending[0][1].done():
+                    pending[0][1].set_exception(e)
+                return
+            # Don't let one bad request fail everyone else in the window
+            for item in pending:
+                await self._score([item])
+            return
+        self.batches += 1
+        self.rows += len(rows)
+        scores = np.asarray(scores, dtype=float)
+        start = 0
+        for patients, future in pending:
+            if not future.done():
+                future.set_result(scores[start:start + len(patients)].tolist())
+            start += len(patients)
+
+
+async def _handle_client(batcher, explainer, shadow, reader, writer):
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                if request.get('ping'):
+                    reply = {'pong': True, 'batches': batcher.batches + explainer.batches,
+                             'rows': batcher.rows + explainer.rows}
+                elif request.get('contributions'):
+                    # One row per patient: p1 followed by its contributions
+                    rows = await explainer.submit(request['patients'])
+                    reply = {'p1': [r[0] for r in rows], 'contributions': [r[1:] for r in rows]}
+                else:
+                    reply = {'p1': await batcher.submit(request['patients'])}
+                if request.get('shadow') and shadow is not None:
+                    shadow(request['patients'], reply['p1'])
+            except Exception as e:
+                reply = {'error': f"{type(e).__name__}: {e}"}
+            writer.write(json.dumps(reply).encode() + b"\n")
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def _no_explain(patients):
+    raise RuntimeError("this server was started without contributions")
+
+
+def _explain_rows(explain):
+    def score(patients):
+        p1, contributions = explain(patients)
+        return np.column_stack([p1, contributions])
+    return score
+
+
+async def serve(predict, host=DEFAULT_HOST, port=DEFAULT_PORT, window_ms=DEFAULT_WINDOW_MS,
+                max_batch=DEFAULT_MAX_BATCH, started=None, explain=None, shadow=None):
+    # Plain predictions and explanations are batched separately, so a window
+    # of plain requests never pays for contributions. shadow(patients, p1)
+    # gets the requests marked as live traffic
+    batcher = MicroBatcher(predict, window_ms, max_batch)
+    explainer = MicroBatcher(_explain_rows(explain) if explain else _no_explain, window_ms, max_batch)
+    tasks = [asyncio.create_task(batcher.run()), asyncio.create_task(explainer.run())]
+    server = await asyncio.start_server(lambda r, w: _handle_client(batcher, explainer, shadow, r, w), host, port)
+    if started is not None:
+        started(server.sockets[0].getsockname()[1])
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def start_in_thread(predict, host=DEFAULT_HOST, port=0, **kwargs):
+    # Runs the server on a daemon thread; returns the port it listens on
+    ready = threading.Event()
+    bound = []
+
+    def started(p):
+        bound.append(p)
+        ready.set()
+
+    thread = threading.Thread(
+        target=lambda: asyncio.run(serve(predict, host, port, started=started, **kwargs)),
+        daemon=True,
+    )
+    thread.start()
+    if not ready.wait(timeout=60):
+        raise RuntimeError("Prediction server did not start")
+    return bound[0]
+
+
+# --- Client ---
+class PredictionClient:
+    # One connection per thread: Streamlit runs each session on its own thread,
+    # and separate sockets let their requests land in the same server batch
+    def __init__(self, address, timeout=30):
+        self.host, self.port = parse_address(address) if isinstance(address, str) else address
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = self._local.conn = (sock, sock.makefile('rb'))
+        return conn
+
+    def _request(self, payload):
+        sock, reader = self._connection()
+        try:
+            sock.sendall(json.dumps(payload).encode() + b"\n")
+            line = reader.readline()
+            if not line:
+                raise ConnectionError("Prediction server closed the connection")
+        except (OSError, ConnectionError):
+            self.close()
+            raise
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise RuntimeError(f"Prediction server error: {reply['error']}")
+        return reply
+
+    @staticmethod
+    def _records(patients):
+        if hasattr(patients, 'to_dict'):
+            patients = patients.to_dict(orient='records')
+        return [{k: (v.item() if hasattr(v, 'item') else v) for k, v in p.items()} for p in patients]
+
+    def predict(self, patients, shadow=False):
+        return self._request(self._payload(patients, shadow))['p1']
+
+    def explain(self, patients, shadow=False):
+        reply = self._request(dict(self._payload(patients, shadow), contributions=True))
+        return reply['p1'], reply['contributions']
+
+    def _payload(self, patients, shadow):
+        payload = {'patients': self._records(patients)}
+        if shadow:
+            payload['shadow'] = True
+        return payload
+
+    def ping(self):
+        return self._request({'ping': True})
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn[1].close()
+            conn[0].close()
+            self._local.conn = None
+
+
+def main(argv=None):
+    from scoring import SCORING_BACKEND, ModelService
+
+    parser = argparse.ArgumentParser(description="Micro-batching prediction server for the heart disease model.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--window-ms", type=float, default=DEFAULT_WINDOW_MS,
+                        help="How long to wait for more requests before scoring a batch")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH,
+                        help="Score as soon as this many rows are waiting")
+    parser.add_argument("--backend", default=None, help="Scoring backend: h2o or native")
+    parser.add_argument("--model", default=None, help="Path of the saved H2O model")
+    args = parser.parse_args(argv)
+    if (args.backend or SCORING_BACKEND) == "server":
+        parser.error("the server needs a local backend (h2o or native)")
+
+    service = ModelService(args.backend, args.model)
+    started_at = time.monotonic()
+    if not service.start():
+        parser.exit(1, f"Model initialization failed: {service.error}\n")
+    print(f"Model ready in {time.monotonic() - started_at:.1f}s, "
+          f"serving on {args.host}:{args.port} (window {args.window_ms} ms, max batch {args.max_batch})")
+    try:
+        asyncio.run(serve(service.predict, args.host, args.port, args.window_ms, args.max_batch,
+                          explain=service.explain, shadow=service.submit_shadow))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
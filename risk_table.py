@@ -0,0 +1,349 @@
+# --- Precomputed risk lookup table for degraded mode ---
+#
+# The model's probability over a quantized grid of every patient input, built
+# from the native tree dump (by this CLI, train_model.py, or the app on a
+# background thread when it's missing) and served with a few index
+# computations, no model and no Java. ModelService answers from it when the
+# live scorer is down or misses HEART_LATENCY_BUDGET_MS (see scoring.py).
+#
+# Grid: each numeric field's declared range is cut into equal-width bins
+# (DEFAULT_BINS), every option field keeps all its options. A cell stores the
+# model's *mean* logit over the cell, computed exactly by pushing the cell
+# boxes down each tree (a split cuts the boxes, a leaf adds its value to the
+# boxes it reaches, weighted by their share of the cell), so no sampling is
+# involved and a cell never depends on where in it a grid point happened to
+# fall. Stored as round(255 * p1), one byte per cell.
+#
+# The approximation error against the live model is measured on synthetic
+# patients when the table is built and kept in the header under "error"
+# (mean / p95 / max |p1 - live p1| and the share of patients that land in
+# the same risk band). With the default bins that's a mean of about 0.04 and
+# roughly 87% band agreement - fine to keep the app answering, not a
+# substitute for the model, which is why the app labels these results.
+#
+# File layout mirrors the native flat file: [magic][header length: u8]
+# [JSON header][pad to 64][uint8 table, C order over FEATURE_COLUMNS].
+# Memory-mapped read-only, so every worker shares one page-cache copy.
+#
+#   python risk_table.py [model_path] [--bins Age=8 RestingBP=6 ...] [--backend h2o]
+
+import argparse
+import itertools
+import json
+import os
+
+import numpy as np
+
+from native_scorer import NativeGBM, artifact_path_for, flat_path_for
+from patient_fields import CATEGORY_OPTIONS, PATIENT_DEFAULTS, random_patients, required_fields
+
+TABLE_FORMAT = 1
+TABLE_MAGIC = b"HDRISKTB"
+TABLE_ALIGN = 64
+# Bins per numeric field; the option fields add 2*4*2*3*2*3 = 288 combinations
+DEFAULT_BINS = {'Age': 8, 'RestingBP': 6, 'Cholesterol': 8, 'MaxHR': 8, 'Oldpeak': 8}
+ERROR_CHECK_ROWS = 5000
+
+
+def risk_table_path_for(model_path):
+    return model_path + ".risk.bin"
+
+
+def native_model_id(model_path):
+    # model_id of the model's native dump, None without one
+    for path in (flat_path_for(model_path), artifact_path_for(model_path)):
+        if os.path.exists(path):
+            try:
+                return NativeGBM.load(path).model_id
+            except (OSError, ValueError, KeyError):
+                return None
+    return None
+
+
+def _align(n):
+    return -(-n // TABLE_ALIGN) * TABLE_ALIGN
+
+
+class Axis:
+    # One table dimension: equal-width bins over [lo, hi], or a list of options.
+    # Values outside the range go to the end bins; unknown or missing values
+    # use the field's default, like the schema does
+    def __init__(self, name, lo=None, hi=None, bins=None, options=None):
+        self.name = name
+        self.options = options
+        if options is not None:
+            self.size = len(options)
+            self._codes = {option: i for i, option in enumerate(options)}
+            self._default = self._codes[PATIENT_DEFAULTS[name]]
+        else:
+            self.lo, self.hi, self.size = float(lo), float(hi), int(bins)
+            self.width = (self.hi - self.lo) / self.size
+            self._default = self.index(PATIENT_DEFAULTS[name])
+
+    @classmethod
+    def from_header(cls, spec):
+        return cls(spec['name'], options=spec['options']) if 'options' in spec else \
+            cls(spec['name'], spec['lo'], spec['hi'], spec['bins'])
+
+    def header(self):
+        if self.options is not None:
+            return {'name': self.name, 'options': self.options}
+        return {'name': self.name, 'lo': self.lo, 'hi': self.hi, 'bins': self.size}
+
+    def index(self, value):
+        if self.options is not None:
+            return self._codes.get(value, self._default)
+        try:
+            i = int((float(value) - self.lo) / self.width)
+        except (TypeError, ValueError):
+            return self._default
+        return 0 if i < 0 else self.size - 1 if i >= self.size else i
+
+    def indices(self, values):
+        if self.options is not None:
+            return np.array([self._codes.get(v, self._default) for v in values], dtype=np.intp)
+        x = np.asarray(values, dtype=float)
+        i = np.clip(np.floor((x - self.lo) / self.width), 0, self.size - 1)
+        return np.where(np.isnan(x), self._default, i).astype(np.intp)
+
+    def edges(self):
+        return self.lo + self.width * np.arange(self.size + 1)
+
+
+def default_axes(bins=None):
+    bins = {**DEFAULT_BINS, **(bins or {})}
+    axes = []
+    for key, _, vrange in required_fields:
+        if key in CATEGORY_OPTIONS:
+            axes.append(Axis(key, options=CATEGORY_OPTIONS[key]))
+        else:
+            axes.append(Axis(key, vrange[0], vrange[1], bins[key]))
+    return axes
+
+
+# --- Build (from the native tree dump, no H2O) ---
+def _split(axis, column, state, model, node):
+    # (left, right) parts of one axis' state at a split on `axis`; None when
+    # a side is empty. Numeric states are (bins, lo, hi), option states (options,)
+    if axis.options is None:
+        bins, lo, hi = state
+        t = model.threshold[node]
+        keep_left, keep_right = lo < t, hi > t
+        left = (bins[keep_left], lo[keep_left], np.minimum(hi[keep_left], t)) if keep_left.any() else None
+        right = (bins[keep_right], np.maximum(lo[keep_right], t), hi[keep_right]) if keep_right.any() else None
+        return left, right
+    (options,) = state
+    goes_left = column[options]
+    if model.domains[model.feature[node]] is None:
+        # An option field the model treats as a number (FastingBS 0/1)
+        goes_left = goes_left < model.threshold[node]
+    else:
+        known = goes_left >= 0
+        codes = np.where(known, goes_left, 0)
+        goes_left = np.where(known, (int(model.left_mask[node]) >> codes) & 1 == 1, model.na_left[node])
+    left, right = options[goes_left], options[~goes_left]
+    return (left,) if left.size else None, (right,) if right.size else None
+
+
+def _boxes(state):
+    # The sub-box as slices: every axis' bins split into contiguous runs
+    # (numeric bins always are one run), so each add happens in place on a
+    # view instead of through a gather/scatter copy
+    runs = []
+    for s in state:
+        bins = s[0]
+        breaks = np.flatnonzero(np.diff(bins) != 1) + 1
+        runs.append([slice(int(r[0]), int(r[-1]) + 1) for r in np.split(bins, breaks)])
+    return itertools.product(*runs)
+
+
+def build_logits(model, axes):
+    # Each cell's mean of the model's logit over the cell
+    names = [axis.name for axis in axes]
+    axis_of_feature = [names.index(name) for name in model.feature_names]
+    columns = []
+    for axis in axes:
+        if axis.options is None:
+            columns.append(None)
+            continue
+        j = model.feature_names.index(axis.name)
+        codes = model._level_codes[j]
+        if codes is None:
+            columns.append(np.array(axis.options, dtype=float))
+        else:
+            columns.append(np.array([codes.get(str(o), -1) for o in axis.options]))
+
+    shape = [axis.size for axis in axes]
+    total = np.zeros(shape)
+    start = []
+    for axis in axes:
+        bins = np.arange(axis.size)
+        start.append((bins,) if axis.options is not None else (bins, axis.edges()[:-1], axis.edges()[1:]))
+    reshape = [[-1 if i == k else 1 for i in range(len(axes))] for k in range(len(axes))]
+    for root in model.roots:
+        stack = [(int(root), start)]
+        while stack:
+            node, state = stack.pop()
+            j = model.feature[node]
+            if j < 0:
+                # Leaf: add its value to the sub-box, weighted by each bin's covered share
+                weight = 1.0
+                for k, axis in enumerate(axes):
+                    if axis.options is None:
+                        _, lo, hi = state[k]
+                        weight = weight * ((hi - lo) / axis.width).reshape(reshape[k])
+                # Weights only vary along numeric axes, which are always one run
+                value = model.value[node] * weight
+                for box in _boxes(state):
+                    total[box] += value
+                continue
+            k = axis_of_feature[j]
+            left, right = _split(axes[k], columns[k], state[k], model, node)
+            for child, part in ((model.left[node], left), (model.right[node], right)):
+                if part is not None:
+                    stack.append((int(child), state[:k] + [part] + state[k + 1:]))
+    return total + model.init_f
+
+
+class RiskTable:
+    def __init__(self, axes, table, header):
+        self.axes = axes
+        self.table = table
+        self.header = header
+        self.path = header.get('path')
+        self.strides = [int(s) for s in np.cumprod([1] + [a.size for a in axes[:0:-1]])[::-1]]
+        self._flat = table.reshape(-1)
+
+    @classmethod
+    def build(cls, model, axes=None, model_path=None):
+        axes = axes or default_axes()
+        logits = build_logits(model, axes)
+        p1 = 1.0 / (1.0 + np.exp(-logits))
+        table = np.round(p1 * 255).astype(np.uint8)
+        header = {'format': TABLE_FORMAT, 'model_id': model.model_id, 'model_path': model_path,
+                  'axes': [axis.header() for axis in axes], 'error': None}
+        return cls(axes, table, header)
+
+    @classmethod
+    def load(cls, path):
+        raw = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(raw[:len(TABLE_MAGIC)]) != TABLE_MAGIC:
+            raise ValueError(f"{path} is not a risk table")
+        header_len = int(np.frombuffer(raw, '<u8', 1, len(TABLE_MAGIC))[0])
+        start = len(TABLE_MAGIC) + 8
+        header = json.loads(bytes(raw[start:start + header_len]))
+        if header['format'] != TABLE_FORMAT:
+            raise ValueError(f"Unsupported risk table format: {header['format']}")
+        axes = [Axis.from_header(spec) for spec in header['axes']]
+        shape = [axis.size for axis in axes]
+        data_start = _align(start + header_len)
+        table = np.frombuffer(raw, np.uint8, int(np.prod(shape)), data_start).reshape(shape)
+        header['path'] = path
+        return cls(axes, table, header)
+
+    def save(self, path):
+        header = {k: v for k, v in self.header.items() if k != 'path'}
+        header_bytes = json.dumps(header).encode()
+        prefix = TABLE_MAGIC + np.array([len(header_bytes)], dtype='<u8').tobytes() + header_bytes
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(prefix.ljust(_align(len(prefix)), b"\0"))
+            f.write(np.ascontiguousarray(self.table).tobytes())
+        os.replace(tmp, path)
+        self.path = self.header['path'] = path
+
+    @property
+    def error(self):
+        return self.header.get('error')
+
+    def lookup(self, patient_info):
+        # One patient dict -> approximate p1
+        cell = 0
+        for axis, stride in zip(self.axes, self.strides):
+            cell += stride * axis.index(patient_info.get(axis.name))
+        return int(self._flat[cell]) / 255.0
+
+    def predict(self, patients):
+        # Patient dicts (or a DataFrame) -> approximate p1 per patient
+        cells = 0
+        for axis, stride in zip(self.axes, self.strides):
+            if hasattr(patients, 'to_dict'):
+                values = patients[axis.name].to_numpy() if axis.name in patients else [None] * len(patients)
+            else:
+                values = [p.get(axis.name) for p in patients]
+            cells = cells + stride * axis.indices(values)
+        return self._flat[cells] / 255.0
+
+    def measure_error(self, predict, rows=ERROR_CHECK_ROWS, seed=1):
+        # Table vs live model on synthetic patients; stored in the header
+        from scoring import risk_bands
+
+        patients = random_patients(rows, seed=seed)
+        live = np.asarray(predict(patients), dtype=float)
+        approx = self.predict(patients)
+        diff = np.abs(approx - live)
+        self.header['error'] = {
+            'rows': rows,
+            'mean_abs': round(float(diff.mean()), 4),
+            'p95_abs': round(float(np.percentile(diff, 95)), 4),
+            'max_abs': round(float(diff.max()), 4),
+            'band_agreement': round(float((risk_bands(approx * 100) == risk_bands(live * 100)).mean()), 4),
+        }
+        return self.header['error']
+
+    def info(self):
+        return {'path': self.path, 'model_id': self.header.get('model_id'),
+                'cells': int(self.table.size), 'error': self.error}
+
+
+def build_for_model(model_path, bins=None, predict=None):
+    # Builds and saves the table next to the model's native dump; the error
+    # is measured against `predict` (default: the native model itself, which
+    # matches H2O to within 1e-6)
+    flat, dump = flat_path_for(model_path), artifact_path_for(model_path)
+    model = NativeGBM.load(flat if os.path.exists(flat) else dump)
+    table = RiskTable.build(model, default_axes(bins), model_path)
+    table.measure_error(predict or model.predict)
+    table.save(risk_table_path_for(model_path))
+    return table
+
+
+def main(argv=None):
+    import time
+
+    from scoring import MODEL_PATH
+
+    parser = argparse.ArgumentParser(description="Precompute the risk lookup table used when the live model is unavailable.")
+    parser.add_argument("model", nargs="?", default=MODEL_PATH, help="Path of the saved H2O model (its native dump must exist)")
+    parser.add_argument("--bins", nargs="*", default=[], metavar="FIELD=N",
+                        help=f"Bins per numeric field (default {' '.join(f'{k}={v}' for k, v in DEFAULT_BINS.items())})")
+    parser.add_argument("--backend", default=None,
+                        help="Measure the error against this scoring backend instead of the native dump (e.g. h2o)")
+    args = parser.parse_args(argv)
+
+    try:
+        bins = {name: int(n) for name, n in (b.split("=") for b in args.bins)}
+    except ValueError:
+        parser.error("--bins takes FIELD=N pairs")
+    unknown = set(bins) - set(DEFAULT_BINS)
+    if unknown:
+        parser.error(f"not a numeric field: {', '.join(sorted(unknown))}")
+    if not os.path.exists(artifact_path_for(args.model)) and not os.path.exists(flat_path_for(args.model)):
+        parser.exit(1, f"No native dump for {args.model}; export it first with `python native_scorer.py`\n")
+    predict = None
+    if args.backend:
+        from scoring import load_scorer
+
+        predict = load_scorer(args.backend, args.model).predict
+
+    started = time.perf_counter()
+    table = build_for_model(args.model, bins, predict)
+    error = table.error
+    print(f"Wrote {table.path} ({table.table.size} cells, {os.path.getsize(table.path)} bytes) "
+          f"in {time.perf_counter() - started:.1f}s")
+    print(f"Error vs live model on {error['rows']} synthetic patients: mean |dp1| {error['mean_abs']:.3f}, "
+          f"p95 {error['p95_abs']:.3f}, max {error['max_abs']:.3f}; same risk band {error['band_agreement']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
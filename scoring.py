@@ -0,0 +1,605 @@
+# --- Scoring backends for the heart disease model ---
+#
+# HEART_SCORING_BACKEND selects how patients are scored:
+#   "h2o"    - the saved H2O model on a local JVM (default)
+#   "native" - the exported tree dump evaluated with NumPy, no Java needed
+#              (export it once with `python native_scorer.py`); served from
+#              the memory-mapped flat file, which all workers share
+#   "server" - a shared micro-batching prediction server at
+#              HEART_PREDICTION_SERVER (see prediction_server.py)
+#
+# Whatever the backend, a precomputed risk table (risk_table.py) next to the
+# model is the fallback for single predictions: it answers while the live
+# scorer is down, and when a prediction misses HEART_LATENCY_BUDGET_MS.
+
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import numpy as np
+
+from metrics import metrics, stage
+from model_registry import ModelRegistry
+from native_scorer import NativeGBM, artifact_path_for, flat_path_for
+from patient_fields import CATEGORICAL_COLUMNS, FEATURE_COLUMNS, PATIENT_DEFAULTS
+from prediction_cache import DEFAULT_CACHE_SIZE, PredictionCache, patient_key
+from risk_table import RiskTable, build_for_model, native_model_id, risk_table_path_for
+
+logger = logging.getLogger(__name__)
+
+BUNDLED_MODEL_PATH = "GBM_grid_1_AutoML_1_20250730_201105_model_4"
+
+
+def registry_model_path(registry=None):
+    # The registry's active model, or the bundled one
+    try:
+        return (registry or ModelRegistry()).active_path() or BUNDLED_MODEL_PATH
+    except (OSError, ValueError, KeyError):
+        return BUNDLED_MODEL_PATH
+
+
+# HEART_MODEL_PATH pins one model; otherwise the service follows the registry
+PINNED_MODEL_PATH = os.environ.get("HEART_MODEL_PATH")
+MODEL_PATH = PINNED_MODEL_PATH or registry_model_path()
+SCORING_BACKEND = os.environ.get("HEART_SCORING_BACKEND", "h2o")
+PREDICTION_SERVER = os.environ.get("HEART_PREDICTION_SERVER", "127.0.0.1:8765")
+PREDICTION_CACHE_SIZE = int(os.environ.get("HEART_PREDICTION_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+# Risk table to fall back on (default: next to the model, built from the
+# native dump if missing; "" disables it), and how long a single prediction
+# may take before the table answers instead (0, the default, waits for the
+# live model however long it takes)
+RISK_TABLE_PATH = os.environ.get("HEART_RISK_TABLE")
+LATENCY_BUDGET_MS = float(os.environ.get("HEART_LATENCY_BUDGET_MS", 0))
+# Live predictions that may run at once under the latency budget; when all are
+# busy (still finishing requests that missed it) the table answers right away
+LIVE_SCORING_WORKERS = 2
+
+# Per-feature contributions in log-odds, plus the baseline; each row sums to
+# the model's logit, so p1 = sigmoid(row sum). Every scorer's explain()
+# returns (p1, contributions) from one scoring pass.
+BIAS_TERM = "BiasTerm"
+CONTRIBUTION_COLUMNS = FEATURE_COLUMNS + [BIAS_TERM]
+
+# One patient's prediction as cached and shown by the app. `source` is the
+# file that scored it: the model, or the risk table for an approximate result
+# (which has no contributions)
+Explanation = namedtuple('Explanation', ['p1', 'contributions', 'source'])
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-np.asarray(x, dtype=float)))
+
+
+class H2OScorer:
+    name = "h2o"
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.model = None
+        self.connect()
+
+    def connect(self):
+        import h2o
+
+        # Reduced memory and a single thread for cloud deployment; connects to
+        # a running local cluster if there is one, otherwise starts a new JVM
+        h2o.init(
+            max_mem_size="256M",
+            min_mem_size="128M",
+            nthreads=1,
+            strict_version_check=False,
+            verbose=False
+        )
+        h2o.no_progress()
+        # The JVM resolves relative paths against its own working directory
+        self.model = h2o.load_model(os.path.abspath(self.model_path))
+
+    def is_healthy(self):
+        import h2o
+
+        try:
+            return h2o.cluster().is_running() and h2o.get_model(self.model.model_id) is not None
+        except Exception:
+            return False
+
+    def _frame(self, patients):
+        import h2o
+        import pandas as pd
+
+        with stage("build_dataframe"):
+            df = patients if isinstance(patients, pd.DataFrame) else pd.DataFrame(patients, columns=FEATURE_COLUMNS)
+        with stage("h2o_upload"):
+            hf = h2o.H2OFrame(df[FEATURE_COLUMNS])
+        with stage("asfactor"):
+            for c in CATEGORICAL_COLUMNS:
+                hf[c] = hf[c].asfactor()
+        return hf
+
+    def predict(self, patients):
+        hf = self._frame(patients)
+        with stage("predict"):
+            pred = self.model.predict(hf)
+        with stage("fetch_result"):
+            if hf.nrow == 1:
+                return np.array([pred['p1'][0, 0]], dtype=float)
+            return np.asarray(pred['p1'].as_data_frame(use_pandas=False, header=False), dtype=float).ravel()
+
+    def explain(self, patients):
+        # TreeSHAP contributions; p1 is rebuilt from their sum instead of a
+        # second predict call
+        hf = self._frame(patients)
+        with stage("predict_contributions"):
+            contrib = self.model.predict_contributions(hf)
+        with stage("fetch_result"):
+            order = [contrib.columns.index(c) for c in CONTRIBUTION_COLUMNS]
+            values = np.asarray(contrib.as_data_frame(use_pandas=False, header=False), dtype=float)
+            values = values.reshape(-1, len(contrib.columns))[:, order]
+        return sigmoid(values.sum(axis=1)), values
+
+
+class NativeScorer:
+    name = "native"
+
+    def __init__(self, model_path):
+        self.model = NativeGBM.load(self.compiled_path(model_path))
+
+    @staticmethod
+    def compiled_path(model_path):
+        # The flat file, compiled from the JSON dump on first use (or when the
+        # dump is newer); falls back to the JSON dump if it can't be written
+        json_path, flat_path = artifact_path_for(model_path), flat_path_for(model_path)
+        try:
+            if os.path.getmtime(flat_path) >= os.path.getmtime(json_path):
+                return flat_path
+        except OSError:
+            if not os.path.exists(json_path):
+                return flat_path
+        try:
+            NativeGBM.load(json_path).save_flat(flat_path)
+        except OSError:
+            return json_path
+        return flat_path
+
+    def connect(self):
+        pass
+
+    def is_healthy(self):
+        return True
+
+    def predict(self, patients):
+        with stage("encode"):
+            X = self.model.encode(patients)
+        with stage("predict"):
+            return self.model.predict_encoded(X)
+
+    def explain(self, patients):
+        with stage("encode"):
+            X = self.model.encode(patients)
+        with stage("predict_contributions"):
+            contributions = self.model.contributions_encoded(X)
+        return sigmoid(contributions.sum(axis=1)), contributions
+
+
+class RemoteScorer:
+    name = "server"
+
+    def __init__(self, model_path):
+        from prediction_server import PredictionClient
+
+        # The server owns the model; model_path only matters on its side
+        self.client = PredictionClient(PREDICTION_SERVER)
+        self.connect()
+
+    def connect(self):
+        self.client.close()
+        self.client.ping()
+
+    def is_healthy(self):
+        try:
+            self.client.ping()
+            return True
+        except Exception:
+            return False
+
+    def predict(self, patients, shadow=False):
+        with stage("server_request"):
+            return np.asarray(self.client.predict(patients, shadow), dtype=float)
+
+    def explain(self, patients, shadow=False):
+        with stage("server_request"):
+            p1, contributions = self.client.explain(patients, shadow)
+        return np.asarray(p1, dtype=float), np.asarray(contributions, dtype=float).reshape(-1, len(CONTRIBUTION_COLUMNS))
+
+
+# --- Risk bands shown by the app and written by batch scoring ---
+RISK_BANDS = [(70, "HIGH"), (40, "MODERATE"), (20, "LOW-MODERATE")]
+LOWEST_RISK_BAND = "LOW"
+
+
+def risk_band(prob_pct):
+    for threshold, band in RISK_BANDS:
+        if prob_pct > threshold:
+            return band
+    return LOWEST_RISK_BAND
+
+
+def risk_bands(prob_pct):
+    # Vectorized risk_band; NaN probabilities get an empty band
+    prob_pct = np.asarray(prob_pct, dtype=float)
+    bands = np.select([prob_pct > t for t, _ in RISK_BANDS], [b for _, b in RISK_BANDS], LOWEST_RISK_BAND)
+    return np.where(np.isnan(prob_pct), "", bands)
+
+
+BACKENDS = {
+    H2OScorer.name: H2OScorer,
+    NativeScorer.name: NativeScorer,
+    RemoteScorer.name: RemoteScorer,
+}
+
+
+def load_scorer(backend=None, model_path=None):
+    backend = backend or SCORING_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown scoring backend '{backend}' (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[backend](model_path or MODEL_PATH)
+
+
+# --- Process-wide model service ---
+#
+# Streamlit re-executes app.py on every interaction, but imported modules stay
+# loaded, so the service below is created once per process and shared by all
+# sessions and reruns. It owns the scorer (H2O connection + loaded model),
+# warms it up with one prediction, and reconnects if the JVM goes away.
+# Single-patient predictions are scored together with their contributions and
+# go through an LRU cache keyed on the model and the patient.
+#
+# Unless a model path is pinned, the service follows the model registry: it
+# polls the manifest, loads and warms up a newly activated version on a
+# background thread, then swaps it in with one reference assignment. Requests
+# already running keep the scorer they started with. A candidate version in
+# the manifest is shadow-scored on the same live single-patient inputs (see
+# shadow_scoring.py).
+#
+# Single predictions degrade instead of failing: while the scorer is warming
+# up or down, explain_one answers from the risk table, and with a latency
+# budget the live call runs on a small pool and the table answers if it
+# misses the budget (the late live result still lands in the cache). Table
+# answers are never cached, so the next request tries the live model again.
+# A missing table is built from the native dump on a background thread, and
+# one built for a different model_id is not used.
+
+RETRY_INTERVAL_SECS = 30
+REGISTRY_POLL_SECS = 2
+
+
+class ModelService:
+    def __init__(self, backend=None, model_path=None, registry=None):
+        self.backend = backend or SCORING_BACKEND
+        pinned = model_path or PINNED_MODEL_PATH
+        # A prediction server follows the registry on its own side
+        self.registry = None if pinned or self.backend == RemoteScorer.name else (registry or ModelRegistry())
+        self.model_path = pinned or registry_model_path(self.registry)
+        self.scorer = None
+        self.error = None
+        self.shadow = None
+        self.swap_error = None
+        self._last_attempt = None
+        self._lock = threading.Lock()
+        self._warmup_thread = None
+        self._warmup_lock = threading.Lock()
+        self._registry_signature = self.registry.signature() if self.registry else None
+        self._registry_checked = time.monotonic()
+        self._swap_thread = None
+        self.cache = PredictionCache(PREDICTION_CACHE_SIZE, watch_paths=self._watch_paths(self.model_path))
+        self.fallback_error = None
+        self.live_error = None
+        self.fallback = self._load_fallback(self.model_path)
+        self._fallback_thread = None
+        self._fallback_attempted = None
+        self.latency_budget = LATENCY_BUDGET_MS / 1000
+        # Runs live predictions under the latency budget; threads start on first use
+        self._pool = ThreadPoolExecutor(max_workers=LIVE_SCORING_WORKERS, thread_name_prefix="live-scoring")
+        self._live_slots = threading.BoundedSemaphore(LIVE_SCORING_WORKERS)
+
+    @staticmethod
+    def _watch_paths(model_path):
+        return [model_path, artifact_path_for(model_path), flat_path_for(model_path)]
+
+    def _load_fallback(self, model_path, model_id=None):
+        # The model's risk table; None if there is none, it can't be read, or
+        # it was built for another model (model_id: the loaded model's, else
+        # the native dump's)
+        path = risk_table_path_for(model_path) if RISK_TABLE_PATH is None else RISK_TABLE_PATH
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            table = RiskTable.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            self.fallback_error = e
+            return None
+        return table if self._fallback_matches(table, model_id or native_model_id(model_path)) else None
+
+    def _fallback_matches(self, table, model_id):
+        if model_id is None or table.header.get('model_id') == model_id:
+            return True
+        self.fallback_error = ValueError(f"{table.path} was built for {table.header.get('model_id')}, not {model_id}")
+        logger.warning("Not using the risk table: %s", self.fallback_error)
+        return False
+
+    @staticmethod
+    def _model_id(scorer):
+        return getattr(getattr(scorer, 'model', None), 'model_id', None)
+
+    def build_fallback_background(self):
+        # Builds the default risk table from the native dump (a few seconds)
+        # when it is missing or stale; tried once per model path
+        with self._warmup_lock:
+            if self.fallback is not None or RISK_TABLE_PATH is not None or self.building_fallback:
+                return
+            model_path = self.model_path
+            if self._fallback_attempted == model_path or native_model_id(model_path) is None:
+                return
+            self._fallback_attempted = model_path
+            self._fallback_thread = threading.Thread(target=self._build_fallback, args=(model_path,),
+                                                     name="risk-table-build", daemon=True)
+            self._fallback_thread.start()
+
+    def _build_fallback(self, model_path):
+        try:
+            build_for_model(model_path)
+            table = RiskTable.load(risk_table_path_for(model_path))
+        except Exception as e:
+            self.fallback_error = e
+            logger.warning("Building the risk table for %s failed: %r", model_path, e)
+            return
+        # A swap may have happened meanwhile; the table is kept for that model only
+        if model_path == self.model_path and self._fallback_matches(table, self._model_id(self.scorer)):
+            self.fallback, self.fallback_error = table, None
+
+    @property
+    def building_fallback(self):
+        return self._fallback_thread is not None and self._fallback_thread.is_alive()
+
+    @property
+    def ready(self):
+        return self.scorer is not None
+
+    @property
+    def warming_up(self):
+        return self._warmup_thread is not None and self._warmup_thread.is_alive()
+
+    @property
+    def swapping(self):
+        return self._swap_thread is not None and self._swap_thread.is_alive()
+
+    def start_background(self):
+        # Kick off start() on a daemon thread so the caller (the first page
+        # render) doesn't wait for the JVM; safe to call on every rerun
+        self.build_fallback_background()
+        with self._warmup_lock:
+            if self.scorer is not None or self.warming_up:
+                return
+            self._warmup_thread = threading.Thread(target=self.start, name="model-warmup", daemon=True)
+            self._warmup_thread.start()
+
+    def wait_ready(self, timeout=None):
+        thread = self._warmup_thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.ready
+
+    def _load(self, model_path):
+        scorer = load_scorer(self.backend, model_path)
+        scorer.explain([PATIENT_DEFAULTS])
+        return scorer
+
+    def start(self):
+        # Load and warm up the model; failures are kept in `error` and retried
+        # at most every RETRY_INTERVAL_SECS so reruns don't hammer a dead JVM
+        with self._lock:
+            if self.scorer is not None:
+                return True
+            now = time.monotonic()
+            if self._last_attempt is not None and now - self._last_attempt < RETRY_INTERVAL_SECS:
+                return False
+            self._last_attempt = now
+            try:
+                scorer = self._load(self.model_path)
+            except Exception as e:
+                self.error = e
+                return False
+            self.scorer, self.error = scorer, None
+            fallback = self.fallback
+            if fallback is not None and not self._fallback_matches(fallback, self._model_id(scorer)):
+                self.fallback = None
+            # Let the first registry check pick up a candidate to shadow
+            self._registry_signature = None
+        self.check_registry(force=True)
+        return True
+
+    # --- Registry: hot swap and shadow scoring ---
+    def check_registry(self, force=False):
+        # Cheap enough for every request: one stat() every REGISTRY_POLL_SECS.
+        # Loading happens on a background thread, never on the request path
+        if self.registry is None or self.scorer is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._registry_checked < REGISTRY_POLL_SECS:
+            return
+        self._registry_checked = now
+        signature = self.registry.signature()
+        if signature == self._registry_signature or self.swapping:
+            return
+        self._registry_signature = signature
+        self._swap_thread = threading.Thread(target=self._apply_registry, name="model-swap", daemon=True)
+        self._swap_thread.start()
+
+    def _apply_registry(self):
+        try:
+            manifest = self.registry.read()
+            active = self.registry.active_path(manifest) or BUNDLED_MODEL_PATH
+            candidate = self.registry.candidate_path(manifest)
+        except (OSError, ValueError, KeyError) as e:
+            self.swap_error = e
+            return
+        if active != self.model_path:
+            try:
+                scorer = self._load(active)
+            except Exception as e:
+                # Keep serving the current model; retried when the manifest changes
+                self.swap_error = e
+                metrics.inc("model_swaps_total", result="failed")
+                return
+            fallback = self._load_fallback(active, self._model_id(scorer))
+            with self._lock:
+                self.scorer, self.model_path, self.swap_error = scorer, active, None
+                self.fallback = fallback
+            self.cache.watch(self._watch_paths(active))
+            metrics.inc("model_swaps_total", result="ok")
+        self._sync_shadow(manifest['candidate'] if candidate else None, candidate, manifest['active'])
+
+    def _sync_shadow(self, version, model_path, live_version):
+        from shadow_scoring import ShadowScorer
+
+        current = self.shadow
+        if current is not None and (current.model_path, current.live_version) == (model_path, live_version):
+            return
+        if current is not None:
+            current.stop()
+            self.shadow = None
+        if model_path is None:
+            return
+        if current is not None and current.model_path == model_path:
+            scorer = current.scorer
+        else:
+            try:
+                scorer = self._load(model_path)
+            except Exception as e:
+                self.swap_error = e
+                return
+        self.shadow = ShadowScorer(scorer, version, live_version, model_path)
+
+    def health(self):
+        return {
+            'backend': self.backend,
+            'model_path': self.model_path,
+            'ready': self.ready,
+            'warming_up': self.warming_up,
+            'healthy': self.ready and self.scorer.is_healthy(),
+            'error': str(self.error) if self.error else None,
+            'registry': self.registry.manifest_path if self.registry else None,
+            'swapping': self.swapping,
+            'swap_error': str(self.swap_error) if self.swap_error else None,
+            'shadow': self.shadow.stats() if self.shadow else None,
+            'cache': self.cache.stats(),
+            'fallback': self.fallback.info() if self.fallback else None,
+            'fallback_building': self.building_fallback,
+            'fallback_error': str(self.fallback_error) if self.fallback_error else None,
+            'latency_budget_ms': self.latency_budget * 1000 or None,
+            'live_error': repr(self.live_error) if self.live_error else None,
+        }
+
+    def reconnect(self, scorer=None):
+        with self._lock:
+            (scorer or self.scorer).connect()
+
+    def _call(self, method, patients, shadow=False):
+        if not self.start():
+            raise RuntimeError(f"Model is not available: {self.error}")
+        self.check_registry()
+        scorer = self.scorer
+        # A prediction server shadows on its side, so it's told which calls to
+        kwargs = {'shadow': True} if shadow and isinstance(scorer, RemoteScorer) else {}
+        try:
+            result = getattr(scorer, method)(patients, **kwargs)
+        except Exception:
+            if scorer.is_healthy():
+                raise
+            # The JVM died under us: bring it back and retry once
+            self.reconnect(scorer)
+            result = getattr(scorer, method)(patients, **kwargs)
+        if shadow:
+            self.submit_shadow(patients, result if method == "predict" else result[0])
+        return result
+
+    def submit_shadow(self, patients, p1):
+        # Only live single-patient predictions are shadowed; what-if grids and
+        # batch files would crowd them out of the candidate's queue and stats
+        shadow = self.shadow
+        if shadow is not None:
+            shadow.submit(patients, p1)
+
+    def predict(self, patients, shadow=False):
+        return self._call("predict", patients, shadow)
+
+    def explain(self, patients, shadow=False):
+        # (p1, contributions) with columns CONTRIBUTION_COLUMNS
+        return self._call("explain", patients, shadow)
+
+    def _explain_live(self, key, model_path, patient_info):
+        p1, contributions = self.explain([patient_info], shadow=True)
+        explanation = Explanation(float(p1[0]), dict(zip(CONTRIBUTION_COLUMNS, map(float, contributions[0]))),
+                                  model_path)
+        self.cache.put(key, explanation)
+        return explanation
+
+    def _approximate(self, fallback, patient_info, reason):
+        metrics.inc("fallback_predictions_total", reason=reason)
+        with stage("risk_table"):
+            return Explanation(fallback.lookup(patient_info), None, fallback.path)
+
+    def explain_one(self, patient_info):
+        self.check_registry()
+        with stage("cache_lookup"):
+            model_path, fallback = self.model_path, self.fallback
+            key = (model_path, patient_key(patient_info))
+            explanation = self.cache.get(key)
+        metrics.inc("prediction_cache_lookups_total", result="hit" if explanation is not None else "miss")
+        if explanation is not None:
+            return explanation
+        if fallback is None:
+            return self._explain_live(key, model_path, patient_info)
+        if not self.ready:
+            # Don't wait for the warm-up (or a dead JVM): answer now, retry later
+            self.start_background()
+            return self._approximate(fallback, patient_info, "unavailable")
+        try:
+            if not self.latency_budget:
+                return self._explain_live(key, model_path, patient_info)
+            # Never queue behind live calls that already missed the budget
+            if not self._live_slots.acquire(blocking=False):
+                return self._approximate(fallback, patient_info, "busy")
+            try:
+                future = self._pool.submit(self._explain_live, key, model_path, patient_info)
+            except Exception:
+                self._live_slots.release()
+                raise
+            future.add_done_callback(lambda _: self._live_slots.release())
+            return future.result(timeout=self.latency_budget)
+        except FutureTimeout:
+            return self._approximate(fallback, patient_info, "latency_budget")
+        except Exception as e:
+            # The scorer failed and couldn't be brought back (or a bug): keep
+            # the cause visible in health() and the log
+            self.live_error = e
+            logger.warning("Live scoring failed, answering from the risk table", exc_info=True)
+            return self._approximate(fallback, patient_info, "error")
+
+    def predict_one(self, patient_info):
+        return self.explain_one(patient_info).p1
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_model_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ModelService()
+        return _service
@@ -0,0 +1,141 @@
+# --- Shadow scoring of a candidate model on live traffic ---
+#
+# The live path only enqueues (patients, live p1); a daemon thread scores the
+# queued rows with the candidate in batches and keeps running disagreement
+# statistics. When the queue is full, rows are dropped rather than delaying a
+# user. On the H2O backend both models share the JVM, so shadow batches still
+# compete with live requests for its threads.
+
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+from metrics import metrics
+from patient_fields import FEATURE_COLUMNS
+from scoring import risk_bands
+
+logger = logging.getLogger(__name__)
+
+SHADOW_MAX_PENDING_ROWS = 10000
+SHADOW_MAX_BATCH = 512
+# Collect rows this long before scoring: fewer, larger candidate calls keep
+# the shadow thread from competing with live requests for the GIL
+SHADOW_WINDOW_SECS = 0.5
+SHADOW_LOG_EVERY = 500
+
+
+class ShadowScorer:
+    def __init__(self, scorer, version, live_version, model_path, max_pending_rows=SHADOW_MAX_PENDING_ROWS):
+        self.scorer = scorer
+        self.version = version
+        self.live_version = live_version
+        self.model_path = model_path
+        self.max_pending_rows = max_pending_rows
+        self.rows = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_error = None
+        self.abs_diff_sum = 0.0
+        self.max_abs_diff = 0.0
+        self.band_disagreements = 0
+        self.flips = 0
+        self._pending_rows = 0
+        self._logged_at = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"shadow-{version}", daemon=True)
+        self._thread.start()
+
+    def submit(self, patients, live_p1):
+        n = len(live_p1)
+        with self._lock:
+            if self._pending_rows + n > self.max_pending_rows:
+                self.dropped += n
+                metrics.inc("shadow_dropped_rows_total", n, candidate=self.version)
+                return
+            self._pending_rows += n
+        self._queue.put((patients, np.asarray(live_p1, dtype=float)))
+
+    def stop(self):
+        self._queue.put(None)
+
+    def _run(self):
+        import pandas as pd
+
+        while True:
+            items = [self._queue.get()]
+            size = len(items[0][1]) if items[0] is not None else 0
+            deadline = time.monotonic() + SHADOW_WINDOW_SECS
+            while items[-1] is not None and size < SHADOW_MAX_BATCH:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                if items[-1] is not None:
+                    size += len(items[-1][1])
+            stop = items[-1] is None
+            items = [item for item in items if item is not None]
+            if items:
+                frames = [p if isinstance(p, pd.DataFrame) else pd.DataFrame(p, columns=FEATURE_COLUMNS)
+                          for p, _ in items]
+                rows = pd.concat(frames, ignore_index=True)[FEATURE_COLUMNS]
+                live = np.concatenate([p1 for _, p1 in items])
+                try:
+                    self._compare(live, np.asarray(self.scorer.predict(rows), dtype=float))
+                except Exception as e:
+                    with self._lock:
+                        self.errors += len(live)
+                        self.last_error = str(e)
+                    metrics.inc("shadow_errors_total", len(live), candidate=self.version)
+                with self._lock:
+                    self._pending_rows -= len(live)
+            if stop:
+                return
+
+    def _compare(self, live, shadow):
+        diff = np.abs(shadow - live)
+        band_disagreements = int((risk_bands(shadow * 100) != risk_bands(live * 100)).sum())
+        flips = int(((shadow >= 0.5) != (live >= 0.5)).sum())
+        with self._lock:
+            self.rows += len(live)
+            self.abs_diff_sum += float(diff.sum())
+            self.max_abs_diff = max(self.max_abs_diff, float(diff.max()))
+            self.band_disagreements += band_disagreements
+            self.flips += flips
+            stats = self._stats()
+            log_now = self.rows - self._logged_at >= SHADOW_LOG_EVERY
+            if log_now:
+                self._logged_at = self.rows
+        metrics.inc("shadow_rows_total", len(live), candidate=self.version)
+        metrics.inc("shadow_band_disagreements_total", band_disagreements, candidate=self.version)
+        metrics.set_gauge("shadow_mean_abs_diff", stats['mean_abs_diff'], candidate=self.version)
+        if log_now:
+            logger.info("Shadow %s vs %s: %d rows, mean |dp1| %.4f, max %.4f, risk band differs %.1f%%, "
+                        "class flips %.1f%%", self.version, self.live_version, stats['rows'],
+                        stats['mean_abs_diff'], stats['max_abs_diff'],
+                        100 * stats['band_disagreement_rate'], 100 * stats['flip_rate'])
+
+    def _stats(self):
+        rows = self.rows
+        return {
+            'candidate': self.version,
+            'live': self.live_version,
+            'rows': rows,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'mean_abs_diff': self.abs_diff_sum / rows if rows else 0.0,
+            'max_abs_diff': self.max_abs_diff,
+            'band_disagreement_rate': self.band_disagreements / rows if rows else 0.0,
+            'flip_rate': self.flips / rows if rows else 0.0,
+        }
+
+    def stats(self):
+        with self._lock:
+            return self._stats()
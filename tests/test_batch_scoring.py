@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from batch_scoring import score_file
+from scoring import CONTRIBUTION_COLUMNS
+
+ROWS = [
+    # Chunks of 2: a valid pair, a pair with invalid cells, an all-invalid
+    # pair and a last short chunk
+    {'Age': '54', 'Sex': 'M', 'RestingBP': '140', 'Cholesterol': '239', 'Oldpeak': '1,5', 'note': 'a'},
+    {'Age': '61', 'Sex': 'female', 'RestingBP': '', 'Cholesterol': '0', 'Oldpeak': '0', 'note': ''},
+    {'Age': 'abc', 'Sex': 'F', 'RestingBP': '130', 'Cholesterol': '250', 'Oldpeak': '2', 'note': 'b'},
+    {'Age': '45', 'Sex': 'M', 'RestingBP': '900', 'Cholesterol': '180', 'Oldpeak': 'x', 'note': ''},
+    {'Age': '200', 'Sex': '?', 'RestingBP': '120', 'Cholesterol': '200', 'Oldpeak': '1', 'note': ''},
+    {'Age': '', 'Sex': 'Q', 'RestingBP': '120', 'Cholesterol': '200', 'Oldpeak': '1', 'note': ''},
+    {'Age': '70', 'Sex': 'M', 'RestingBP': '150', 'Cholesterol': '300', 'Oldpeak': '3.2', 'note': 'c'},
+]
+
+
+def _explain(rows):
+    # Scoring only ever sees valid rows with the model dtypes
+    assert rows['Age'].dtype == np.int64 and rows['Oldpeak'].dtype == np.float64
+    assert rows['Sex'].isin(['M', 'F']).all()
+    return np.full(len(rows), 0.25), np.zeros((len(rows), len(CONTRIBUTION_COLUMNS)))
+
+
+def test_csv_to_parquet_with_invalid_rows_across_chunks(tmp_path):
+    source, target = tmp_path / 'patients.csv', tmp_path / 'results.parquet'
+    pd.DataFrame(ROWS).to_csv(source, index=False)
+
+    summary = score_file(str(source), str(target), chunksize=2, explain=_explain)
+
+    assert summary == {'rows': 7, 'scored': 3, 'invalid': 4}
+    assert pq.ParquetFile(target).metadata.num_row_groups == 4
+    result = pd.read_parquet(target)
+    assert result['Age'].dtype == np.int64 and result['Oldpeak'].dtype == np.float64
+    assert result['Age'].tolist() == [54, 61, 50, 45, 50, 50, 70]
+    assert result['Sex'].tolist() == ['M', 'F', 'F', 'M', 'M', 'M', 'M']
+    invalid = result['errors'] != ''
+    assert invalid.tolist() == [False, False, True, True, True, True, False]
+    assert result['p1'][~invalid].eq(0.25).all() and result['p1'][invalid].isna().all()
+    assert result['risk_band'][invalid].eq('').all()
+    assert "(got 'abc')" in result['errors'][2]
+    assert "(got '900')" in result['errors'][3] and "(got 'x')" in result['errors'][3]
+    assert "(got '200')" in result['errors'][4] and "(got '?')" in result['errors'][4]
+    assert result['note'].fillna('').tolist() == ['a', '', 'b', '', '', '', 'c']
+
+
+def test_csv_output_matches_parquet(tmp_path):
+    source = tmp_path / 'patients.csv'
+    pd.DataFrame(ROWS).to_csv(source, index=False)
+    score_file(str(source), str(tmp_path / 'results.csv'), chunksize=2, explain=_explain)
+    score_file(str(source), str(tmp_path / 'results.parquet'), chunksize=3, explain=_explain)
+
+    as_csv = pd.read_csv(tmp_path / 'results.csv', keep_default_na=False)
+    as_parquet = pd.read_parquet(tmp_path / 'results.parquet')
+    assert as_csv['errors'].tolist() == as_parquet['errors'].tolist()
+    assert as_csv['Age'].tolist() == as_parquet['Age'].tolist()
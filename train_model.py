@@ -0,0 +1,199 @@
+# --- Offline training pipeline (replaces the interactive notebook) ---
+#
+# Trains the heart disease model from a local heart.csv (the Kaggle
+# "heart-failure-prediction" file) and writes a versioned output directory:
+#
+#   models/<version>/<model_id>               saved H2O leader model
+#   models/<version>/<model_id>.native.json   tree dump for the native backend
+#   models/<version>/<model_id>.native.bin    ...and its memory-mapped form
+#   models/<version>/<model_id>.risk.bin      fallback risk table (risk_table.py)
+#   models/<version>/leaderboard.csv          AutoML leaderboard
+#   models/<version>/metrics.json             test metrics, parameters, data hash
+#
+# and registers the version in models/manifest.json (see model_registry.py),
+# activating it unless --no-activate is given.
+#
+#   python train_model.py --data heart.csv --max-runtime-secs 120 --seed 42
+#
+# The parsed, typed training frame is cached under .cache/ keyed on the CSV's
+# hash, so reruns skip parsing and validation. AutoML runs on every core
+# (--nthreads -1). A time budget alone is not reproducible, because the number
+# of models trained depends on machine speed; pass --max-models for runs that
+# repeat exactly with the same seed.
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+
+from model_registry import MODELS_DIR, ModelRegistry
+from native_scorer import NativeGBM, artifact_path_for, export_model, flat_path_for
+from patient_fields import CATEGORICAL_COLUMNS, CATEGORY_OPTIONS, FEATURE_COLUMNS, INTEGER_COLUMNS
+from risk_table import build_for_model
+
+TARGET = "HeartDisease"
+DEFAULT_DATA = "heart.csv"
+DEFAULT_CACHE_DIR = os.path.join(".cache", "training")
+# Bump when the cached frame's layout or validation changes
+CACHE_VERSION = 1
+
+# Typed training columns: factors as strings, the rest numeric
+CSV_DTYPES = {key: str for key in CATEGORICAL_COLUMNS}
+CSV_DTYPES.update({key: 'int64' for key in INTEGER_COLUMNS + ['FastingBS', TARGET]})
+CSV_DTYPES['Oldpeak'] = 'float64'
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_training_csv(path):
+    df = pd.read_csv(path)
+    missing = [c for c in FEATURE_COLUMNS + [TARGET] if c not in df.columns]
+    if missing:
+        raise ValueError(f"{path} is missing columns: {', '.join(missing)}")
+    df = df[FEATURE_COLUMNS + [TARGET]]
+    if df.isna().any().any():
+        raise ValueError(f"{path} has empty values in: {', '.join(df.columns[df.isna().any()])}")
+    df = df.astype(CSV_DTYPES)
+    for key, options in CATEGORY_OPTIONS.items():
+        unknown = set(df[key]) - set(options)
+        if unknown:
+            raise ValueError(f"{path}: {key} has values outside {options}: {sorted(map(str, unknown))}")
+    if set(df[TARGET]) - {0, 1}:
+        raise ValueError(f"{path}: {TARGET} must be 0 or 1")
+    return df
+
+
+def load_training_frame(path, cache_dir=DEFAULT_CACHE_DIR):
+    # Returns (frame, sha256 of the CSV, whether it came from the cache)
+    digest = file_sha256(path)
+    cache_path = os.path.join(cache_dir, f"heart_{digest[:16]}_v{CACHE_VERSION}.pkl")
+    if os.path.exists(cache_path):
+        return pd.read_pickle(cache_path), digest, True
+    df = parse_training_csv(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{cache_path}.{os.getpid()}.tmp"
+    df.to_pickle(tmp)
+    os.replace(tmp, cache_path)
+    return df, digest, False
+
+
+def to_h2o(df):
+    import h2o
+
+    column_types = {c: 'enum' if c in CATEGORICAL_COLUMNS or c == TARGET else 'numeric' for c in df.columns}
+    return h2o.H2OFrame(df, column_types=column_types)
+
+
+def test_metrics(perf):
+    threshold, f1 = perf.F1()[0]
+    return {
+        'auc': perf.auc(),
+        'aucpr': perf.aucpr(),
+        'logloss': perf.logloss(),
+        'rmse': perf.rmse(),
+        'max_f1': f1,
+        'max_f1_threshold': threshold,
+        'accuracy_at_max_f1': perf.accuracy(thresholds=[threshold])[0][1],
+    }
+
+
+def train(args):
+    import h2o
+    from h2o.automl import H2OAutoML
+
+    started = time.monotonic()
+    version = args.version or time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    out_dir = os.path.join(args.models_dir, version)
+    if os.path.exists(out_dir):
+        raise SystemExit(f"{out_dir} already exists")
+    df, digest, cached = load_training_frame(args.data, args.cache_dir)
+    print(f"Loaded {len(df)} rows from {args.data} ({'cached frame' if cached else 'parsed'})")
+
+    h2o.init(nthreads=args.nthreads, max_mem_size=args.max_mem_size, strict_version_check=False, verbose=False)
+    h2o.no_progress()
+    cores = h2o.cluster().cloud_size * h2o.cluster().nodes[0]['num_cpus']
+    hf = to_h2o(df)
+    train_frame, test_frame = hf.split_frame(ratios=[1 - args.test_ratio], seed=args.seed)
+
+    # A fresh project per version: reusing a project name on a running
+    # cluster would add to the previous run's leaderboard
+    aml = H2OAutoML(max_runtime_secs=args.max_runtime_secs, max_models=args.max_models, seed=args.seed,
+                    include_algos=args.algos, project_name=f"heart_{version}")
+    aml.train(x=FEATURE_COLUMNS, y=TARGET, training_frame=train_frame)
+    leader = aml.leader
+
+    os.makedirs(out_dir)
+    model_path = h2o.save_model(leader, path=os.path.abspath(out_dir), force=False)
+    model_path = os.path.join(out_dir, os.path.basename(model_path))
+
+    # The native backend only handles binomial GBMs
+    native = risk_table = None
+    if leader.algo == "gbm":
+        artifact = export_model(leader, artifact_path_for(model_path), reference=df[FEATURE_COLUMNS])
+        NativeGBM.load(artifact_path_for(model_path)).save_flat(flat_path_for(model_path))
+        native = artifact['verification']
+        risk_table = build_for_model(model_path).error
+    else:
+        print(f"Leader is a {leader.algo} model, skipping the native export and risk table (GBM only)")
+
+    leaderboard = aml.leaderboard.as_data_frame(use_pandas=True)
+    leaderboard.to_csv(os.path.join(out_dir, "leaderboard.csv"), index=False)
+    report = {
+        'version': version,
+        'model_id': leader.model_id,
+        'algo': leader.algo,
+        'test': test_metrics(leader.model_performance(test_frame)),
+        'rows': {'train': train_frame.nrow, 'test': test_frame.nrow},
+        'native_export': native,
+        'risk_table': risk_table,
+        'data': {'path': os.path.abspath(args.data), 'sha256': digest},
+        'params': {
+            'seed': args.seed, 'max_runtime_secs': args.max_runtime_secs, 'max_models': args.max_models,
+            'algos': args.algos, 'test_ratio': args.test_ratio, 'nthreads': args.nthreads,
+        },
+        'cluster': {'h2o_version': h2o.__version__, 'cores': cores},
+        'models_trained': len(leaderboard),
+        'elapsed_secs': time.monotonic() - started,
+    }
+    with open(os.path.join(out_dir, "metrics.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    ModelRegistry(args.models_dir).register(version, model_path, report, activate=not args.no_activate)
+    print(f"Leader {leader.model_id}: test AUC {report['test']['auc']:.4f}, "
+          f"logloss {report['test']['logloss']:.4f} ({len(leaderboard)} models on {cores} cores)")
+    print(f"Wrote {out_dir}, registered as {version}" + ("" if args.no_activate else " (active)"))
+    return out_dir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the heart disease model with H2O AutoML.")
+    parser.add_argument("--data", default=DEFAULT_DATA, help="Local heart.csv")
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--max-runtime-secs", type=int, default=120, help="AutoML time budget")
+    parser.add_argument("--max-models", type=int, default=None,
+                        help="Stop after this many models (makes runs reproducible)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--algos", nargs="+", default=["GBM"],
+                        help="AutoML algorithms to search (the native backend needs a GBM leader)")
+    parser.add_argument("--test-ratio", type=float, default=0.2)
+    parser.add_argument("--nthreads", type=int, default=-1, help="H2O threads (-1 = all cores)")
+    parser.add_argument("--max-mem-size", default=None, help="H2O heap, e.g. 4G")
+    parser.add_argument("--version", default=None, help="Output version name (default: UTC timestamp)")
+    parser.add_argument("--no-activate", action="store_true",
+                        help="Register without making it the active model (e.g. to shadow it first)")
+    args = parser.parse_args(argv)
+    train(args)
+
+
+if __name__ == "__main__":
+    main()
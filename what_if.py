@@ -0,0 +1,46 @@
+# --- "What if" sensitivity of the risk to each input ---
+#
+# Every variant of the patient (a sweep over each numeric range declared in
+# required_fields, and every alternative value of each categorical field) is
+# scored in a single batched call.
+
+import numpy as np
+import pandas as pd
+
+from patient_fields import CATEGORY_OPTIONS, FEATURE_COLUMNS, INTEGER_COLUMNS, required_fields
+
+SWEEP_POINTS = 13
+
+
+def sweep_values(key, vrange, current, points=SWEEP_POINTS):
+    values = np.linspace(vrange[0], vrange[1], points)
+    if key in INTEGER_COLUMNS:
+        values = np.round(values).astype(int)
+    else:
+        values = np.round(values, 1)
+    return sorted(set(values.tolist()) | {current})
+
+
+def build_variants(patient_info, points=SWEEP_POINTS):
+    # One row per (feature, value) pair, with every other field held fixed
+    rows, labels = [], []
+    for key, _, vrange in required_fields:
+        if key in CATEGORY_OPTIONS:
+            values = CATEGORY_OPTIONS[key]
+        else:
+            values = sweep_values(key, vrange, patient_info[key], points)
+        for value in values:
+            variant = dict(patient_info)
+            variant[key] = value
+            rows.append(variant)
+            labels.append((key, value, value == patient_info[key]))
+    variants = pd.DataFrame(rows, columns=FEATURE_COLUMNS)
+    index = pd.DataFrame(labels, columns=['feature', 'value', 'is_current'])
+    return variants, index
+
+
+def what_if(patient_info, predict, points=SWEEP_POINTS):
+    # Returns a frame of feature / value / is_current / risk_pct
+    variants, result = build_variants(patient_info, points)
+    result['risk_pct'] = np.asarray(predict(variants), dtype=float) * 100
+    return result